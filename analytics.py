@@ -0,0 +1,161 @@
+"""
+Spending analytics over columnar bill data.
+
+timeseries() works on the bills' columnar snapshot (see snapshot.py: amount as
+float64, category codes, due dates as days since 1970-01-01, a paid mask) and
+buckets them per day, week or month with a handful of vectorised passes;
+timeseries_python() is the straightforward loop it replaces, kept as the
+reference for benchmarks and for checking results.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from fields import parse_amount, parse_date, to_day
+
+GRANULARITIES = ("day", "week", "month")
+
+# Rolling average window (in periods) when none is requested
+DEFAULT_WINDOWS = {"day": 7, "week": 4, "month": 3}
+
+
+def period_keys(days, granularity):
+    """Map day numbers to the period they belong to (a day, the Monday of the week, or a month index)"""
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 was a Thursday, so (day + 3) % 7 is 0 on Mondays
+        return days - (days + 3) % 7
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+
+
+def period_labels(first, count, granularity):
+    if granularity == "month":
+        return np.datetime_as_string(np.arange(first, first + count).astype('datetime64[M]'), unit='M').tolist()
+    step = 7 if granularity == "week" else 1
+    return np.datetime_as_string(np.arange(first, first + count * step, step).astype('datetime64[D]'), unit='D').tolist()
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` periods (shorter at the start of the series)"""
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+
+def timeseries(columns, granularity, start, end, window=None, extra=None):
+    """
+    Spending per period between two dates (inclusive), overall, per category,
+    paid vs pending, plus a trailing rolling average of the total.
+
+    `extra` optionally adds rows that are not stored bills (e.g. expanded
+    recurring occurrences) as a (days, amounts, category_codes, paid) tuple
+    using the same category codes as `columns`.
+    """
+    window = window or DEFAULT_WINDOWS[granularity]
+    days, amounts, codes, paid = columns.days, columns.amounts, columns.category_codes, columns.paid
+    if extra is not None:
+        days = np.concatenate((days, extra[0]))
+        amounts = np.concatenate((amounts, extra[1]))
+        codes = np.concatenate((codes, extra[2]))
+        paid = np.concatenate((paid, extra[3]))
+
+    start_day, end_day = to_day(start), to_day(end)
+    in_range = (days >= start_day) & (days <= end_day)
+    days, amounts, codes, paid = days[in_range], amounts[in_range], codes[in_range], paid[in_range]
+
+    first = int(period_keys(np.array([start_day]), granularity)[0])
+    last = int(period_keys(np.array([end_day]), granularity)[0])
+    step = 7 if granularity == "week" else 1
+    count = (last - first) // step + 1
+    slots = (period_keys(days, granularity) - first) // step
+
+    n_categories = len(columns.categories)
+    by_category = np.bincount(slots * n_categories + codes, weights=amounts,
+                              minlength=count * n_categories).reshape(count, n_categories)
+    total = by_category.sum(axis=1)
+    paid_total = np.bincount(slots, weights=np.where(paid, amounts, 0.0), minlength=count)
+    bill_counts = np.bincount(slots, minlength=count)
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rolling_window": window,
+        "periods": period_labels(first, count, granularity),
+        "total": np.round(total, 2).tolist(),
+        "paid": np.round(paid_total, 2).tolist(),
+        "pending": np.round(total - paid_total, 2).tolist(),
+        "bill_count": bill_counts.tolist(),
+        "rolling_average": np.round(rolling_mean(total, window), 2).tolist(),
+        "by_category": {
+            category: np.round(by_category[:, code], 2).tolist()
+            for code, category in enumerate(columns.categories)
+            if by_category[:, code].any()
+        },
+    }
+
+
+def _period_start(due_date, granularity):
+    if granularity == "day":
+        return due_date
+    if granularity == "week":
+        return due_date - timedelta(days=due_date.weekday())
+    return due_date.replace(day=1)
+
+
+def timeseries_python(bills, granularity, start, end, window=None):
+    """Pure-Python reference implementation of timeseries() over TinyDB documents"""
+    window = window or DEFAULT_WINDOWS[granularity]
+    first, last = _period_start(start, granularity), _period_start(end, granularity)
+    periods = []
+    current = first
+    while current <= last:
+        periods.append(current)
+        if granularity == "month":
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current += timedelta(days=7 if granularity == "week" else 1)
+    slot_of = {period: i for i, period in enumerate(periods)}
+
+    total = [0.0] * len(periods)
+    paid = [0.0] * len(periods)
+    bill_count = [0] * len(periods)
+    by_category = {}
+    for bill in bills:
+        due_date = parse_date(bill.get('due_date'))
+        if due_date is None or not start <= due_date <= end:
+            continue
+        slot = slot_of[_period_start(due_date, granularity)]
+        amount = parse_amount(bill)
+        category = bill.get('category', 'Other')
+        total[slot] += amount
+        bill_count[slot] += 1
+        if bill.get('paid'):
+            paid[slot] += amount
+        by_category.setdefault(category, [0.0] * len(periods))[slot] += amount
+
+    rolling = []
+    for i in range(len(periods)):
+        recent = total[max(0, i - window + 1):i + 1]
+        rolling.append(sum(recent) / len(recent))
+
+    labels = [p.strftime('%Y-%m') if granularity == "month" else p.isoformat() for p in periods]
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rolling_window": window,
+        "periods": labels,
+        "total": [round(v, 2) for v in total],
+        "paid": [round(v, 2) for v in paid],
+        "pending": [round(t - p, 2) for t, p in zip(total, paid)],
+        "bill_count": bill_count,
+        "rolling_average": [round(v, 2) for v in rolling],
+        "by_category": {
+            category: [round(v, 2) for v in values]
+            for category, values in by_category.items()
+            if any(values)
+        },
+    }
@@ -1,13 +1,32 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+from flask import Flask, request, jsonify, send_from_directory, Response
+from werkzeug.middleware.proxy_fix import ProxyFix
 from tinydb import TinyDB, Query
+from tinydb.storages import JSONStorage
 from flask_mail import Mail, Message
 import datetime
+from datetime import date, timedelta
 import google.generativeai as genai
 import json
 from dotenv import load_dotenv  # Add this import
-import random
+import itertools
+import shutil
+import tempfile
+import functools
+import hashlib
+import numpy as np
+from backup import (BackupError, ChangeJournal, COMPRESSIONS, ProcessLock, apply_changes,
+                    compress_chunks, decompress_stream, is_changes_stream, load_database_file,
+                    parse_changes, read_file_chunks)
+from analytics import GRANULARITIES, timeseries
+from fields import days_to_iso, from_day, parse_date, to_day
+from recurrence import RecurrenceIndex, RecurrenceRule
+from snapshot import MISSING_DATE, NO_DATE, SnapshotStore
+from sample_bills import make_sample_bill
+from search import DEFAULT_THRESHOLD, FIELDS, BillSearchIndex
+from limits import Limit, LimitExceeded, Limiter, LimiterStore
+from responses import (COMPRESSIBLE_MIMETYPES, MIN_COMPRESS_BYTES, coded_etag, encode_body,
+                       matching_etag, negotiate_coding)
 
 # Load environment variables from .env file
 load_dotenv()  # This loads the variables from .env
@@ -23,7 +42,10 @@ import os
 from tinydb import TinyDB
 
 # Create a directory path that works with Render's free tier
-if os.environ.get('RENDER'):
+if os.environ.get('DB_PATH'):
+    # Explicit override (used by the benchmark suite to run against a scratch database)
+    db_path = os.environ['DB_PATH']
+elif os.environ.get('RENDER'):
     # Use /tmp directory for Render (will be wiped on redeploy but works for free tier)
     os.makedirs('/tmp/billtracker', exist_ok=True)
     db_path = '/tmp/billtracker/bills.json'
@@ -31,108 +53,313 @@ else:
     # Local development path
     db_path = 'bills.json'
 
-db = TinyDB(db_path)
+# Every TinyDB operation goes through one lock: the storage keeps a single open file
+# handle, so concurrent requests would otherwise interleave seeks and corrupt the file.
+# The lock file extends it to the other worker processes sharing the database.
+db_lock = ProcessLock(db_path + '.lock')
+
+class LockedJSONStorage(JSONStorage):
+    def read(self):
+        with db_lock:
+            return super().read()
+
+    def write(self, data):
+        with db_lock:
+            super().write(data)
+
+db = TinyDB(db_path, storage=LockedJSONStorage)
+
+# Append-only log of writes; its version doubles as the store version
+journal = ChangeJournal(db_path + '.changes', lock=db_lock)
+
+# Callables notified with each journal entry after a write, or {"op": "reset"} after a restore
+change_listeners = []
+
+def _notify_change(entry):
+    for listener in change_listeners:
+        try:
+            listener(entry)
+        except Exception as e:
+            print(f"Error in change listener: {str(e)}")
+
+def sync_with_other_workers():
+    """
+    Replay the writes other worker processes have journaled since this one last
+    looked (a single stat when there are none). TinyDB is reopened first: the
+    other process may have replaced the file, and the cached next doc id and
+    query results are stale either way.
+    """
+    if not journal.changed_on_disk():
+        return
+    with db_lock:
+        entries = journal.sync()
+        if entries:
+            _reopen_database()
+            for entry in entries:
+                _notify_change(entry)
+
+def _record_change(op, doc_ids, docs=None):
+    """Journal a write and notify listeners (call with db_lock held)"""
+    if not doc_ids:
+        return
+    if op == 'upsert':
+        if docs is None:
+            table = db.storage.read().get('_default', {})
+            docs = {str(doc_id): table[str(doc_id)] for doc_id in doc_ids if str(doc_id) in table}
+        entry = journal.append('upsert', {"docs": docs})
+    else:
+        entry = journal.append('remove', {"ids": [int(doc_id) for doc_id in doc_ids]})
+    _notify_change(entry)
+
+# All writes to the bills table go through these helpers so they are journaled
+def insert_bills(documents):
+    with db_lock:
+        sync_with_other_workers()
+        documents = [dict(document) for document in documents]
+        doc_ids = db.insert_multiple(documents)
+        _record_change('upsert', doc_ids, {str(doc_id): document for doc_id, document in zip(doc_ids, documents)})
+    return doc_ids
+
+def insert_bill(document):
+    return insert_bills([document])[0]
+
+def update_bills(fields, cond=None, doc_ids=None):
+    with db_lock:
+        sync_with_other_workers()
+        updated = db.update(fields, cond, doc_ids=doc_ids)
+        _record_change('upsert', updated)
+    return updated
+
+def remove_bills(cond=None, doc_ids=None):
+    with db_lock:
+        sync_with_other_workers()
+        removed = db.remove(cond, doc_ids=doc_ids)
+        _record_change('remove', removed)
+    return removed
+
+def _database_dir():
+    return os.path.dirname(os.path.abspath(db_path))
+
+def _reopen_database():
+    """Point db at a fresh TinyDB on db_path (call with db_lock held)"""
+    global db
+    # A fresh handle drops the old inode, the query cache and the cached next id. The old
+    # one is left open: requests that looked up db before the swap may still read through
+    # it, and it is closed once the last of them lets go of it
+    db = TinyDB(db_path, storage=LockedJSONStorage)
+
+def _swap_database_file(new_path):
+    """Atomically replace the live database file and reopen TinyDB on it (call with db_lock held)"""
+    os.replace(new_path, db_path)
+    _reopen_database()
+
+def restore_database_file(new_path, version=None, epoch=None):
+    """
+    Swap in a validated full database file and start a new journal epoch.
+    Keeping this store's own epoch is only allowed from its current version on:
+    rewinding it would hand out version numbers that already named other content.
+    """
+    with db_lock:
+        sync_with_other_workers()
+        if epoch == journal.epoch and version is not None and version < journal.version:
+            raise BackupError(
+                f"Backup is from version {version} of this store, which is already at version {journal.version}; "
+                f"restore it without an epoch to start a new history"
+            )
+        _swap_database_file(new_path)
+        journal.reset(journal.version + 1 if version is None else version, epoch)
+        _notify_change({"v": journal.version, "op": "reset"})
+
+def apply_incremental_backup(header, entries):
+    """Apply an incremental backup taken from this store's current version"""
+    with db_lock:
+        sync_with_other_workers()
+        if header.get("epoch") != journal.epoch or header.get("since") != journal.version:
+            raise BackupError(
+                f"Incremental backup starts at version {header.get('since')} of epoch {header.get('epoch')}, "
+                f"but the store is at version {journal.version} of epoch {journal.epoch}"
+            )
+        data = db.storage.read() or {}
+        apply_changes(data.setdefault('_default', {}), entries)
+
+        fd, tmp_path = tempfile.mkstemp(prefix='restore-', suffix='.json', dir=_database_dir())
+        with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+            json.dump(data, handle)
+        _swap_database_file(tmp_path)
+        journal.extend(entries)
+        _notify_change({"v": journal.version, "op": "reset"})
+
+def _keep_index_in_sync(index):
+    """Build an index (update/remove/rebuild by doc id) now and keep it up to date from the change journal"""
+    def listener(entry):
+        if entry['op'] == 'upsert':
+            for doc_id, bill in entry['docs'].items():
+                index.update(int(doc_id), bill)
+        elif entry['op'] == 'remove':
+            for doc_id in entry['ids']:
+                index.remove(doc_id)
+        else:
+            index.rebuild((db.storage.read() or {}).get('_default', {}))
+
+    change_listeners.append(listener)
+    listener({"op": "reset"})
+    return index
+
+# Recurring bills are expanded on demand from this index instead of being stored per occurrence
+recurrence_index = _keep_index_in_sync(RecurrenceIndex())
+
+# Trigram index over bill names and notes for fuzzy search
+search_index = _keep_index_in_sync(BillSearchIndex())
+
+# Read endpoints share a columnar snapshot of the bills, kept in sync from the change journal
+# (including the entries other workers journal, see sync_with_other_workers)
+snapshots = SnapshotStore(lambda: (db.storage.read() or {}).get('_default', {}), db_lock,
+                          version=journal.version)
+change_listeners.append(snapshots.on_change)
 
 # Create a function to generate sample data
 #small change
 def generate_sample_data():
     """Generate sample bills if database is empty"""
-    if len(db.all()) == 0:
-        print("Database is empty, generating sample data...")
-        
-        # Categories for bills
-        categories = ["Utilities", "Entertainment", "Subscriptions", 
-                     "Insurance", "Rent", "Transportation", "Food", "Other"]
-        
-        # Sample bill names for each category
-        bill_names = {
-            "Utilities": ["Electricity Bill", "Water Bill", "Gas Bill", "Internet Service"],
-            "Entertainment": ["Netflix", "Disney+", "HBO Max", "Movie Tickets"],
-            "Subscriptions": ["Spotify Premium", "Adobe Creative Cloud", "Microsoft 365", "Amazon Prime"],
-            "Insurance": ["Health Insurance", "Car Insurance", "Renters Insurance", "Life Insurance"],
-            "Rent": ["Apartment Rent", "Storage Unit", "Parking Space"],
-            "Transportation": ["Car Payment", "Bus Pass", "Uber/Lyft", "Fuel"],
-            "Food": ["Grocery Store", "DoorDash", "Hello Fresh", "Restaurant Bills"],
-            "Other": ["Gym Membership", "Phone Bill", "Student Loans", "Credit Card"]
-        }
+    # Under the lock, so workers starting together add them only once
+    with db_lock:
+        sync_with_other_workers()
+        if len(db.all()) == 0:
+            print("Database is empty, generating sample data...")
         
-        # Current date
-        today = datetime.date.today()
+            # Current date
+            today = datetime.date.today()
         
-        # Generate 15 random bills
-        for i in range(1, 16):
-            # Choose random category
-            category = random.choice(categories)
-            
-            # Choose random bill name from that category
-            bill_name = random.choice(bill_names[category])
-            
-            # Determine amount based on category
-            if category == "Rent":
-                amount = round(random.uniform(800, 2500), 2)
-            elif category == "Insurance":
-                amount = round(random.uniform(80, 300), 2)
-            elif category == "Subscriptions":
-                amount = round(random.uniform(5, 30), 2)
-            else:
-                amount = round(random.uniform(15, 200), 2)
-                
-            # Generate due date within next 30 days
-            days_offset = random.randint(1, 30)
-            due_date = today + datetime.timedelta(days=days_offset)
-            due_date_str = due_date.strftime('%Y-%m-%d')
-            
-            # 30% chance the bill is already paid
-            paid = random.random() < 0.3
+            # Generate 15 random bills
+            insert_bills(make_sample_bill(i, today) for i in range(1, 16))
             
-            # Create bill object
-            bill = {
-                "id": i,
-                "bill_name": bill_name,
-                "amount": amount,
-                "due_date": due_date_str,
-                "category": category,
-                "paid": paid,
-                "status": "paid" if paid else "pending",
-                "notes": f"Sample {category.lower()} bill",
-                "recurring": category in ["Subscriptions", "Utilities", "Rent", "Insurance"]
-            }
-            
-            # Add to database
-            db.insert(bill)
-            
-        print(f"Generated {len(db.all())} sample bills")
+            print(f"Generated {len(db.all())} sample bills")
 
 # Create the Flask app
 app = Flask(__name__)
 
-# Enable CORS for all routes - this is the simplest approach for now
-CORS(app, origins=["https://billweb.netlify.app"])
-
-# Let's also add a proper CORS preflight handler
-@app.route('/', defaults={'path': ''}, methods=['OPTIONS'])
-@app.route('/<path:path>', methods=['OPTIONS'])
-def handle_options(path):
-    response = app.make_default_options_response()
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
-    return response
+# Behind Render's proxy the client address is the last X-Forwarded-For hop
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 1 if os.environ.get('RENDER') else 0))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+# CORS headers sent with every response, including preflights
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,If-None-Match',
+    'Access-Control-Allow-Methods': 'GET,PUT,POST,DELETE,OPTIONS',
+    'Access-Control-Expose-Headers': 'ETag,X-DB-Version,X-DB-Epoch,X-Backup-Type',
+}
+
+# How long browsers may reuse a preflight answer (seconds)
+CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 86400))
+
+# Answer every CORS preflight here, before routing
+@app.before_request
+def handle_preflight():
+    if request.method == 'OPTIONS':
+        response = app.make_default_options_response()
+        response.headers['Access-Control-Max-Age'] = str(CORS_MAX_AGE)
+        return response
+
+# Writes made by other workers reach this worker's snapshot and indexes before each request
+@app.before_request
+def catch_up_with_other_workers():
+    sync_with_other_workers()
+
+# Endpoints that call Gemini or decode images: requests per minute and burst per client,
+# and how many may run at once across all workers
+ENDPOINT_LIMITS = {
+    'get_insights': Limit(per_minute=30, burst=10, concurrency=4),
+    'ai_query': Limit(per_minute=20, burst=5, concurrency=4),
+    'classify_bill': Limit(per_minute=60, burst=20, concurrency=4),
+    'categorize_all_bills': Limit(per_minute=2, burst=1, concurrency=1, queue_timeout=0),
+    'extract_bill_data': Limit(per_minute=20, burst=5, concurrency=2),
+}
+
+# Limiter state is shared by every worker through this SQLite file
+limiter = Limiter(
+    LimiterStore(os.environ.get('LIMITS_PATH', db_path + '.limits')),
+    ENDPOINT_LIMITS,
+    enabled=os.environ.get('RATE_LIMITS', 'on') != 'off',
+)
+
+def rate_limited(view):
+    """Apply the view's ENDPOINT_LIMITS entry; refused requests get a 429 or 503 with Retry-After"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            slot = limiter.admit(view.__name__, request.remote_addr)
+        except LimitExceeded as e:
+            response = jsonify({"error": str(e), "retry_after": e.retry_after})
+            response.status_code = e.status
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        with slot:
+            return view(*args, **kwargs)
+    return wrapper
+
+def generate_text(prompt, model_name="gemini-flash-lite-latest"):
+    """
+    Gemini's answer to a prompt. Identical prompts that are already being answered
+    (in any worker) wait for that answer instead of making another upstream call.
+    """
+    key = hashlib.sha256(f"{model_name}\n{prompt}".encode('utf-8')).hexdigest()
+    return limiter.single_flight(key, lambda: genai.GenerativeModel(model_name).generate_content(prompt).text)
+
+def current_etag():
+    """
+    Validator for read routes: the store version (plus its epoch, which changes on
+    restores) and today's date, since reminders and default windows move with it.
+    The version is read from the journal all workers share, after catching up with
+    it, so a version names the same content in every worker; the body is built
+    afterwards, so it is never older than its tag.
+    """
+    sync_with_other_workers()
+    return f"{journal.epoch[:12]}-{journal.version}-{date.today().strftime('%Y%m%d')}"
+
+def versioned(view):
+    """Tag a read route's responses with the current ETag and answer If-None-Match with 304"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = current_etag()
+        matched = matching_etag(request.if_none_match, etag)
+        if matched:
+            response = app.response_class(status=304)
+            response.set_etag(matched)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
 
-# Add this function to manually set CORS headers for all responses
 @app.after_request
-def add_cors_headers(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
+def finish_response(response):
+    for header, value in CORS_HEADERS.items():
+        response.headers[header] = value
+    return compress_response(response)
 
-# Add this helper function for CORS preflight responses
-def _build_cors_preflight_response():
-    response = app.make_default_options_response()
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+def compress_response(response):
+    """Compress the body with the client's preferred coding if it is large enough to be worth it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = negotiate_coding(request.accept_encodings)
+    if coding is None:
+        return response
+    response.set_data(encode_body(data, coding))
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(coded_etag(etag, coding))
     return response
 
 # Configure Flask-Mail with credentials from environment variables
@@ -155,28 +382,131 @@ def serve_index():
         "message": "BillTracker API is running",
         "endpoints": [
             "/bills", 
+            "/bills/search",
             "/reminders", 
             "/insights",
+            "/analytics/timeseries",
             "/ai-query",
             "/ping"
         ]
     })
 
+def _normalize_recurrence(data):
+    """Validate a bill's `recurrence` rule in place; raises ValueError for invalid rules"""
+    if data.get('recurrence') is not None:
+        data['recurrence'] = RecurrenceRule.from_dict(data['recurrence']).to_dict()
+        data.setdefault('recurring', True)
+
+# Cap on the span of a ?start=/?end=/?days= window, which bounds how many occurrences
+# one recurring bill can expand into
+MAX_WINDOW_DAYS = 731
+
+def _parse_window(default_days=30):
+    """
+    Read the ?start=, ?end= and ?days= query parameters into an inclusive date window.
+    start defaults to today and end to start + days. Returns None when none of them
+    was given; raises ValueError for dates that cannot be parsed, for windows that
+    end before they start and for windows longer than MAX_WINDOW_DAYS.
+    """
+    if not any(key in request.args for key in ('start', 'end', 'days')):
+        return None
+    start = parse_date(request.args.get('start')) if request.args.get('start') else date.today()
+    if start is None:
+        raise ValueError(f"Could not parse start date '{request.args.get('start')}'")
+    if request.args.get('end'):
+        end = parse_date(request.args.get('end'))
+        if end is None:
+            raise ValueError(f"Could not parse end date '{request.args.get('end')}'")
+    else:
+        try:
+            end = start + timedelta(days=int(request.args.get('days', default_days)))
+        except OverflowError:
+            raise ValueError("Date window is out of range")
+    if end < start:
+        raise ValueError("end must not be before start")
+    if (end - start).days > MAX_WINDOW_DAYS:
+        raise ValueError(f"Date window too large (at most {MAX_WINDOW_DAYS} days)")
+    return start, end
+
+def _expand_recurring(snapshot, start, end, include_next=False):
+    """Occurrences of the snapshot's recurring bills that fall into [start, end], as encoded JSON rows"""
+    doc_ids, indexes, days = recurrence_index.expand(start, end, include_next=include_next)
+    return snapshot.occurrence_rows(doc_ids, indexes, days_to_iso(days))
+
+def _recurring_mask(snapshot):
+    """Rows of the snapshot whose bills are expanded by the recurrence index"""
+    return np.isin(snapshot.doc_ids, recurrence_index.doc_ids())
+
+def _json_rows(rows):
+    """Response for a JSON array of already-encoded bills (same bytes jsonify would send)"""
+    return Response(b'[' + b','.join(rows) + b']\n', mimetype='application/json')
+
 # Add a new bill
 @app.route('/bills', methods=['POST'])
 def add_bill():
     data = request.json
     data['due_date'] = str(data['due_date'])  # Convert date to string for JSON storage
-    db.insert(data)
+    try:
+        _normalize_recurrence(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    insert_bill(data)
     return jsonify({"message": "Bill added successfully!"}), 201
 
-# Get all bills
+# Get all bills, or with ?start=/?end=/?days= every bill occurrence due in that window
 @app.route('/bills', methods=['GET'])
+@versioned
 def get_bills():
-    return jsonify(db.all())
+    try:
+        window = _parse_window()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    snapshot = snapshots.current()
+    if window is None:
+        return _json_rows(snapshot.rows)
+
+    start, end = window
+    in_window = ~_recurring_mask(snapshot) & (snapshot.days >= to_day(start)) & (snapshot.days <= to_day(end))
+    return _json_rows(list(snapshot.rows[in_window]) + _expand_recurring(snapshot, start, end))
+
+# Cap on ?limit= for fuzzy search
+MAX_SEARCH_RESULTS = 100
+
+# Fuzzy search over bill names and notes, best matches first
+@app.route('/bills/search', methods=['GET'])
+@versioned
+def search_bills():
+    """
+    Bills whose name or notes resemble ?q= (typos and extra words are fine), as
+    {"bill", "score", "field"} matches. ?limit= (20 by default), ?threshold= (minimum
+    score between 0 and 1) and ?field=bill_name|notes narrow the results.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "No search query provided"}), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), MAX_SEARCH_RESULTS)
+        threshold = float(request.args.get('threshold', DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer and threshold a number"}), 400
+    if limit < 1 or not 0 <= threshold <= 1:
+        return jsonify({"error": "limit must be positive and threshold between 0 and 1"}), 400
+    field = request.args.get('field')
+    if field is not None and field not in FIELDS:
+        return jsonify({"error": f"field must be one of {', '.join(FIELDS)}"}), 400
+
+    matches = search_index.search(query, limit=limit, threshold=threshold, fields=(field,) if field else FIELDS)
+    snapshot = snapshots.current()
+    rows, found = snapshot.rows_for([doc_id for doc_id, _, _ in matches])
+    results = [
+        {"bill": json.loads(snapshot.rows[row]), "score": round(score, 3), "field": matched_field}
+        for row, (_, score, matched_field) in zip(rows.tolist(), itertools.compress(matches, found.tolist()))
+    ]
+    return jsonify({"query": query, "matches": results})
 
 # Get a single bill by ID
 @app.route('/bills/<int:bill_id>', methods=['GET'])
+@versioned
 def get_bill(bill_id):
     Bill = Query()
     result = db.get(Bill.id == bill_id)
@@ -187,7 +517,11 @@ def get_bill(bill_id):
 def update_bill(bill_id):
     Bill = Query()
     data = request.json
-    db.update(data, Bill.id == bill_id)
+    try:
+        _normalize_recurrence(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    update_bills(data, Bill.id == bill_id)
     return jsonify({"message": "Bill updated successfully!"})
 
 # Delete a bill
@@ -201,19 +535,23 @@ def delete_bill():
     # Check if it's a temporary ID (starts with 'temp-')
     if bill_id and bill_id.startswith('temp-'):
         # For temporary IDs, use string comparison
-        db.remove(Bill.id == bill_id)
+        remove_bills(Bill.id == bill_id)
     else:
         try:
             # For regular numeric IDs, convert to integer
             numeric_id = int(bill_id)
-            db.remove(Bill.id == numeric_id)
+            remove_bills(Bill.id == numeric_id)
         except ValueError:
             # If conversion fails, try as string
-            db.remove(Bill.id == bill_id)
+            remove_bills(Bill.id == bill_id)
             
     return jsonify({'message': 'Bill deleted successfully!'}), 200
 
+# Minimum name similarity for fuzzy deletes; stricter than search so near misses are not removed
+FUZZY_DELETE_THRESHOLD = 0.5
+
 # Add this endpoint to delete bill by name
+
 @app.route('/bills/by-name', methods=['DELETE'])
 def delete_bill_by_name():
     data = request.json
@@ -221,12 +559,50 @@ def delete_bill_by_name():
     if not bill_name:
         return jsonify({"error": "No bill name provided"}), 400
         
-    Bill = Query()
-    removed = db.remove(Bill.bill_name == bill_name)
+    # Exact matches are among the bills the search index files under the same normalised name
+    candidates = search_index.docs_named(bill_name)
+    if candidates:
+        snapshot = snapshots.current()
+        rows, found = snapshot.rows_for(candidates)
+        names = snapshot.names
+        exact = [doc_id for doc_id, row in zip(itertools.compress(candidates, found.tolist()), rows.tolist())
+                 if names[snapshot.name_codes[row]] == bill_name]
+        removed = remove_bills(doc_ids=exact) if exact else []
+    else:
+        Bill = Query()
+        removed = remove_bills(Bill.bill_name == bill_name)
     if removed:
         return jsonify({"message": f"Bill '{bill_name}' deleted successfully!"})
-    else:
-        return jsonify({"message": "Bill not found"}), 404
+
+    # Names coming from the AI assistant are often approximate ("netflix sub" for "Netflix");
+    # with "fuzzy": true (or a "threshold") the bills with the most similar name are removed
+    threshold = data.get('threshold')
+    if data.get('fuzzy') or threshold is not None:
+        try:
+            threshold = FUZZY_DELETE_THRESHOLD if threshold is None else float(threshold)
+        except (TypeError, ValueError):
+            return jsonify({"error": "threshold must be a number"}), 400
+        # A threshold of 0 would let a single shared trigram pick the bill to delete
+        if not 0 < threshold <= 1:
+            return jsonify({"error": "threshold must be greater than 0 and at most 1"}), 400
+        doc_ids, score, tied = search_index.resolve_name(bill_name, threshold)
+        snapshot = snapshots.current()
+        if tied:
+            rows, _ = snapshot.rows_for(tied)
+            candidates = [snapshot.names[code] for code in snapshot.name_codes[rows].tolist()]
+            return jsonify({"error": f"'{bill_name}' matches several bills equally well",
+                            "candidates": candidates}), 409
+        if doc_ids:
+            rows, _ = snapshot.rows_for(doc_ids[:1])
+            matched_name = snapshot.names[snapshot.name_codes[rows[0]]] if len(rows) else bill_name
+            removed = remove_bills(doc_ids=doc_ids)
+            return jsonify({
+                "message": f"Bill '{matched_name}' deleted successfully!",
+                "matched_name": matched_name,
+                "similarity": round(score, 3),
+                "deleted": len(removed)
+            })
+    return jsonify({"message": "Bill not found"}), 404
 
 # Send email reminder
 @app.route('/send-reminder', methods=['POST'])
@@ -267,56 +643,36 @@ def send_reminder():
 
 # Get reminders for upcoming due dates
 @app.route('/reminders', methods=['GET'])
+@versioned
 def get_reminders():
+    """
+    Bills due today or later. Recurring bills contribute each occurrence due
+    before ?end= (or within ?days=, 30 by default), and at least their next one.
+    """
     try:
-        # Fix datetime handling by using explicit imports
-        from datetime import date, datetime as dt
-        today = date.today()  # Fix the method_descriptor error by using date directly
-        upcoming_bills = []
-        
-        for bill in db.all():
-            try:
-                # Check if due_date exists
-                if 'due_date' not in bill or not bill['due_date']:
-                    print(f"Warning: Bill '{bill.get('bill_name', 'Unnamed')}' has no due_date field")
-                    continue
-                
-                # Handle different date formats
-                due_date_str = str(bill['due_date']).strip()
-                due_date = None
-                
-                # Try different date formats
-                date_formats = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d']
-                for fmt in date_formats:
-                    try:
-                        due_date = dt.strptime(due_date_str, fmt).date()
-                        break
-                    except ValueError:
-                        continue
-                
-                # If no format worked, try to parse as ISO format
-                if due_date is None:
-                    try:
-                        # Handle ISO format with or without timezone
-                        if 'T' in due_date_str:
-                            due_date_str = due_date_str.split('T')[0]
-                        due_date = dt.strptime(due_date_str, '%Y-%m-%d').date()
-                    except ValueError:
-                        print(f"Warning: Could not parse due date '{due_date_str}' for bill '{bill.get('bill_name', 'Unnamed')}'")
-                        # Instead of skipping, use today's date as a fallback
-                        due_date = today
-                
-                # Add to upcoming bills if due date is today or in the future
-                if due_date >= today:
-                    upcoming_bills.append(bill)
-                    
-            except Exception as e:
-                print(f"Error processing bill: {str(e)}")
-                # Add the bill anyway to avoid data loss
-                upcoming_bills.append(bill)
-                continue
-                
-        return jsonify(upcoming_bills)
+        today = date.today()
+        try:
+            window = _parse_window()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        horizon = window[1] if window else today + timedelta(days=30)
+        snapshot = snapshots.current()
+        # Recurring bills are expanded below
+        candidates = ~_recurring_mask(snapshot)
+
+        for row in np.flatnonzero(candidates & (snapshot.days == MISSING_DATE)).tolist():
+            print(f"Warning: Bill '{snapshot.names[snapshot.name_codes[row]] or 'Unnamed'}' has no due_date field")
+        unparsed = candidates & (snapshot.days == NO_DATE)
+        for row in np.flatnonzero(unparsed).tolist():
+            # Instead of skipping, these count as due today
+            print(f"Warning: Could not parse due date '{snapshot.due_dates[snapshot.due_date_codes[row]]}' "
+                  f"for bill '{snapshot.names[snapshot.name_codes[row]] or 'Unnamed'}'")
+
+        # Add to upcoming bills if due date is today or in the future
+        upcoming = candidates & ((snapshot.days >= to_day(today)) | unparsed)
+        upcoming_bills = list(snapshot.rows[upcoming])
+        upcoming_bills.extend(_expand_recurring(snapshot, today, horizon, include_next=True))
+        return _json_rows(upcoming_bills)
     except Exception as e:
         print(f"Error in reminders endpoint: {str(e)}")
         import traceback
@@ -325,21 +681,35 @@ def get_reminders():
 
 # Enhanced insights endpoint that uses categories
 @app.route('/insights', methods=['GET'])
+@versioned
+@rate_limited
 def get_insights():
-    bills = db.all()
-    total_spent = sum(bill['amount'] for bill in bills)
-    
+    """
+    Category breakdown of all stored bills, or with ?start=/?end=/?days= of
+    everything due in that window, counting each occurrence of recurring bills.
+    """
+    try:
+        window = _parse_window()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    snapshot = snapshots.current()
+
     # Group bills by category
-    categories = {}
-    for bill in bills:
-        category = bill.get('category', 'Other')
-        if category not in categories:
-            categories[category] = 0
-        categories[category] += bill['amount']
+    if window:
+        # Recurring bills are totalled by the recurrence index
+        in_window = (~_recurring_mask(snapshot) & (snapshot.days >= to_day(window[0]))
+                     & (snapshot.days <= to_day(window[1])))
+        categories = snapshot.category_totals(in_window)
+        for category, amount in recurrence_index.totals_by_category(*window).items():
+            categories[category] = categories.get(category, 0) + amount
+    else:
+        categories = snapshot.category_totals()
+
+    total_spent = sum(categories.values())
     
     # Calculate percentage for each category
     category_percentages = {
-        category: (amount / total_spent) * 100 
+        category: (amount / total_spent) * 100 if total_spent else 0
         for category, amount in categories.items()
     }
     
@@ -347,7 +717,6 @@ def get_insights():
     highest_category = max(categories.items(), key=lambda x: x[1], default=('None', 0))
     
     # Gemini API Call for saving suggestions based on highest category
-    model = genai.GenerativeModel("gemini-flash-lite-latest")
     prompt = f"""
     The user spends the most on {highest_category[0]} category (${highest_category[1]:.2f}).
     Suggest 3 practical ways to save money on {highest_category[0]} expenses.
@@ -355,10 +724,10 @@ def get_insights():
     Format as a bullet point list with 3 items.
     """
     
-    response = model.generate_content(prompt)
-    saving_suggestions = response.text if response.text else "No suggestions available."
+    suggestions = generate_text(prompt)
+    saving_suggestions = suggestions if suggestions else "No suggestions available."
 
-    return jsonify({
+    insights = {
         "total_spent": total_spent,
         "category_breakdown": categories,
         "category_percentages": category_percentages,
@@ -367,14 +736,64 @@ def get_insights():
             "amount": highest_category[1]
         },
         "saving_suggestions": saving_suggestions
-    })
+    }
+    if window:
+        insights["window"] = {"start": window[0].isoformat(), "end": window[1].isoformat()}
+    return jsonify(insights)
+
+# Cap on the number of periods one time series may return
+MAX_TIMESERIES_PERIODS = 5000
+
+@app.route('/analytics/timeseries', methods=['GET'])
+@versioned
+def get_timeseries():
+    """
+    Spending per ?granularity= (day, week or month; month by default) between ?start=
+    and ?end= (defaulting to the first and last due date): totals, per category, paid
+    vs pending, and a rolling average over ?window= periods. ?expand=true also counts
+    future occurrences of recurring bills.
+    """
+    try:
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in GRANULARITIES:
+            return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        window = request.args.get('window')
+        window = int(window) if window else None
+        if window is not None and window < 1:
+            return jsonify({"error": "window must be a positive integer"}), 400
+
+        columns = snapshots.current()
+        first_day, last_day = columns.dated_range() or (to_day(date.today()),) * 2
+        start = parse_date(request.args['start']) if request.args.get('start') else from_day(first_day)
+        end = parse_date(request.args['end']) if request.args.get('end') else from_day(last_day)
+        if start is None or end is None:
+            return jsonify({"error": "start and end must be dates (YYYY-MM-DD)"}), 400
+        if end < start:
+            return jsonify({"error": "end must not be before start"}), 400
+        span = {"day": 1, "week": 7, "month": 28}[granularity]
+        if (end - start).days // span > MAX_TIMESERIES_PERIODS:
+            return jsonify({"error": "Date range too large for this granularity"}), 400
+
+        extra = None
+        if request.args.get('expand', '').lower() in ('1', 'true', 'yes'):
+            doc_ids, indexes, days = recurrence_index.expand(start, end)
+            # Occurrence 0 is the stored bill, which is already counted
+            later = indexes > 0
+            extra = columns.occurrences(doc_ids[later], days[later])
+
+        result = timeseries(columns, granularity, start, end, window=window, extra=extra)
+        result["undated_bills"] = int((columns.days <= MISSING_DATE).sum())
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in timeseries analytics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 # Modified AI query endpoint to better handle service recommendations
-@app.route('/ai-query', methods=['POST', 'OPTIONS'])
+@app.route('/ai-query', methods=['POST'])
+@rate_limited
 def ai_query():
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         data = request.json
         user_query = data.get('query')
@@ -383,11 +802,8 @@ def ai_query():
         if not user_query:
             return jsonify({"error": "No query provided"}), 400
 
-        # Fetch all bills from the database
-        bills = db.all()
-        
         # Prepare a summary of the bills for the AI model
-        bill_summary = [{"name": bill['bill_name'], "amount": bill['amount'], "due_date": bill['due_date']} for bill in bills]
+        bill_summary = snapshots.current().summaries()
         
         # Check if this is a utility-related query
         utility_keywords = [
@@ -475,12 +891,11 @@ DETAILS: {"bill_name": "NAME", "reminder_date": "YYYY-MM-DD"}
         
         # Simplified prompt format for the Gemini model
         try:
-            model = genai.GenerativeModel("gemini-flash-lite-latest")
             # Send as a single text prompt with all the context
             prompt = f"{system_instructions}\n\n{conversation_context}User query: {user_query}\n\nHere are the current bills:\n{bill_summary}{service_data}\n\nPlease provide a relevant response."
             
-            response = model.generate_content(prompt)
-            ai_response = response.text if response.text else "I'm sorry, I couldn't generate a response."
+            answer = generate_text(prompt)
+            ai_response = answer if answer else "I'm sorry, I couldn't generate a response."
         except Exception as api_error:
             print(f"Gemini API error: {str(api_error)}")
             ai_response = f"Error calling AI service: {str(api_error)}"
@@ -502,6 +917,7 @@ def serve_file(filename):
 
 # Add this to your app.py file
 @app.route('/classify-bill', methods=['POST'])
+@rate_limited
 def classify_bill():
     try:
         data = request.json
@@ -511,8 +927,6 @@ def classify_bill():
             return jsonify({"error": "No bill name provided"}), 400
             
         # Call Gemini API to classify the bill
-        model = genai.GenerativeModel("gemini-flash-lite-latest")
-        
         prompt = f"""
         You are a bill categorization assistant. 
         Based on the bill name "{bill_name}", classify it into one of these categories:
@@ -528,8 +942,8 @@ def classify_bill():
         Return only the category name without any explanation.
         """
         
-        response = model.generate_content(prompt)
-        category = response.text.strip() if response.text else "Other"
+        answer = generate_text(prompt)
+        category = answer.strip() if answer else "Other"
         
         # Ensure the category matches one of our predefined categories
         valid_categories = ["Utilities", "Entertainment", "Subscriptions", 
@@ -549,10 +963,12 @@ def classify_bill():
 
 # Add this to app.py - use this once to categorize all existing bills
 @app.route('/admin/categorize-all-bills', methods=['GET'])
+@rate_limited
 def categorize_all_bills():
     try:
         bills = db.all()
         categorized_count = 0
+        answers = {}
         
         for bill in bills:
             # Skip bills that already have a category
@@ -560,8 +976,6 @@ def categorize_all_bills():
                 continue
                 
             # Call Gemini API to classify the bill
-            model = genai.GenerativeModel("gemini-flash-lite-latest")
-            
             prompt = f"""
             You are a bill categorization assistant. 
             Based on the bill name "{bill['bill_name']}", classify it into one of these categories:
@@ -577,8 +991,11 @@ def categorize_all_bills():
             Return only the category name without any explanation.
             """
             
-            response = model.generate_content(prompt)
-            category = response.text.strip() if response.text else "Other"
+            # Bills with the same name share one Gemini call
+            if prompt not in answers:
+                answers[prompt] = generate_text(prompt)
+            answer = answers[prompt]
+            category = answer.strip() if answer else "Other"
             
             # Ensure the category matches one of our predefined categories
             valid_categories = ["Utilities", "Entertainment", "Subscriptions", 
@@ -588,26 +1005,25 @@ def categorize_all_bills():
                 category = "Other"
                 
             # Update the bill with the category
-            db.update({'category': category}, doc_ids=[bill.doc_id])
+            update_bills({'category': category}, doc_ids=[bill.doc_id])
             categorized_count += 1
             
-        return jsonify({
-            "message": f"Successfully categorized {categorized_count} bills",
-            "bills": db.all()
-        })
+        # Same body jsonify would build, but from the snapshot's encoded rows
+        message = json.dumps(f"Successfully categorized {categorized_count} bills").encode('utf-8')
+        rows = snapshots.current().rows
+        return Response(b'{"bills":[' + b','.join(rows) + b'],"message":' + message + b'}\n',
+                        mimetype='application/json')
     except Exception as e:
         print(f"Error categorizing bills: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 # Add this endpoint to get personalized free alternatives based on user's bills
-@app.route('/free-alternatives', methods=['GET', 'OPTIONS'])
+@app.route('/free-alternatives', methods=['GET'])
+@versioned
 def get_free_alternatives():
     """
     Return suggestions for free alternatives to paid services
     """
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-        
     try:
         # In a real implementation, you would analyze the user's bills
         # and suggest relevant free alternatives based on their subscriptions
@@ -655,27 +1071,22 @@ def get_free_alternatives():
 
 # Add endpoint to get average spending percentages from all users
 @app.route('/average-spending', methods=['GET'])
+@versioned
 def get_average_spending():
     try:
-        # Get all bills from the database
-        bills = db.all()
+        snapshot = snapshots.current()
         
-        if not bills:
+        if not len(snapshot):
             return jsonify({})
             
+        # Group bills by category
+        categories = snapshot.category_totals()
+
         # Calculate total amount spent
-        total_spent = sum(bill.get('amount', 0) for bill in bills)
+        total_spent = sum(categories.values())
         
         if total_spent == 0:
             return jsonify({})
-            
-        # Group bills by category
-        categories = {}
-        for bill in bills:
-            category = bill.get('category', 'Other')
-            if category not in categories:
-                categories[category] = 0
-            categories[category] += bill.get('amount', 0)
         
         # Calculate percentage for each category
         category_percentages = {
@@ -688,14 +1099,12 @@ def get_average_spending():
         print(f"Error getting average spending: {str(e)}")
         return jsonify({}), 500
 
-@app.route('/category-comparison', methods=['GET', 'OPTIONS'])
+@app.route('/category-comparison', methods=['GET'])
+@versioned
 def get_category_comparison():
     """
     Return average spending percentages by category for comparison
     """
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-        
     try:
         # Get user's actual percentages (could be used in the future)
         all_bills = db.all()
@@ -721,24 +1130,112 @@ def get_category_comparison():
 
 # Add a route to serve the JSON database file for backup
 @app.route('/api/download-db', methods=['GET'])
+@versioned
 def download_db():
-    return send_from_directory(os.path.dirname(db_path), os.path.basename(db_path), as_attachment=True)
+    """
+    Stream a backup of the database.
+
+    ?compression=gzip|zstd|none picks the encoding (gzip by default).
+    ?since=N (optionally with &epoch=E from a previous backup's X-DB-Epoch header)
+    returns only the changes after version N; if those are no longer available a
+    full backup is sent instead. X-Backup-Type tells the two apart.
+    """
+    compression = request.args.get('compression', 'gzip')
+    if compression not in COMPRESSIONS:
+        return jsonify({"error": f"Unsupported compression '{compression}'"}), 400
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since must be an integer version"}), 400
+
+    with db_lock:
+        version, epoch = journal.version, journal.epoch
+        if since is not None and journal.can_serve(since, request.args.get('epoch', epoch)):
+            backup_type = 'incremental'
+            chunks = journal.iter_changes(since, version)
+            filename = f"bills-changes-{since}-{version}.jsonl"
+        else:
+            # Copy the file under the lock so the stream is a consistent snapshot
+            backup_type = 'full'
+            fd, snapshot_path = tempfile.mkstemp(prefix='backup-', suffix='.json', dir=_database_dir())
+            os.close(fd)
+            shutil.copyfile(db_path, snapshot_path)
+            chunks = read_file_chunks(snapshot_path, delete_after=True)
+            filename = "bills.json"
+
+    mimetype, extension = COMPRESSIONS[compression]
+    response = Response(compress_chunks(chunks, compression), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}{extension}"'
+    response.headers['X-DB-Version'] = str(version)
+    response.headers['X-DB-Epoch'] = epoch
+    response.headers['X-Backup-Type'] = backup_type
+    return response
 
 # Add a route to upload a database backup
 @app.route('/api/upload-db', methods=['POST'])
 def upload_db():
+    """
+    Restore a full or incremental backup (gzip, zstd or plain, detected automatically).
+
+    Full backups are decompressed into a temp file, validated and then swapped in
+    atomically; the optional form fields version/epoch (from the backup's X-DB-*
+    headers) let later incremental backups be applied on top. Incremental backups
+    must start at the store's current version.
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
         
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    tmp_path = None
     try:
-        file.save(db_path)
-        return jsonify({"message": "Database restored successfully"})
+        chunks = decompress_stream(file.stream)
+        head = next(chunks, b'')
+
+        if is_changes_stream(head):
+            header, entries = parse_changes(itertools.chain([head], chunks))
+            try:
+                apply_incremental_backup(header, entries)
+            except BackupError as e:
+                return jsonify({"error": str(e)}), 409
+            return jsonify({
+                "message": "Database updated successfully",
+                "type": "incremental",
+                "changes": len(entries),
+                "version": journal.version
+            })
+
+        version = request.form.get('version')
+        version = int(version) if version not in (None, '') else None
+        fd, tmp_path = tempfile.mkstemp(prefix='restore-', suffix='.json', dir=_database_dir())
+        with os.fdopen(fd, 'wb') as handle:
+            for chunk in itertools.chain([head], chunks):
+                handle.write(chunk)
+        data = load_database_file(tmp_path)
+
+        try:
+            restore_database_file(tmp_path, version=version, epoch=request.form.get('epoch') or None)
+        except BackupError as e:
+            return jsonify({"error": str(e)}), 409
+        tmp_path = None
+        return jsonify({
+            "message": "Database restored successfully",
+            "type": "full",
+            "bills": len(data.get('_default', {})),
+            "version": journal.version
+        })
+    except (BackupError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 @app.route('/ping', methods=['GET'])
 def ping():
@@ -752,14 +1249,12 @@ import re
 from datetime import datetime, timedelta
 import random
 
-@app.route('/extract-bill-data', methods=['POST', 'OPTIONS'])
+@app.route('/extract-bill-data', methods=['POST'])
+@rate_limited
 def extract_bill_data():
     """
     Extract data from bill images using OCR and AI processing
     """
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-        
     try:
         data = request.json
         if not data or 'image' not in data:
@@ -0,0 +1,436 @@
+"""
+Helpers for streaming, compressed and incremental database backups.
+
+Full backups are the TinyDB JSON file streamed through gzip or zstd.
+Incremental backups are a JSON-lines stream of the change journal: a header
+line followed by one line per write, each tagged with the store version it
+produced, so a client can ask for "changes since version N".
+"""
+import json
+import os
+import threading
+import uuid
+import zlib
+
+import zstandard
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the threads of one process are coordinated
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Refuse to inflate uploads past this size (protects against decompression bombs)
+MAX_RESTORE_BYTES = int(os.environ.get("MAX_RESTORE_BYTES", 512 * 1024 * 1024))
+
+CHANGES_FORMAT = "billtracker-changes"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSIONS = {
+    # name: (mimetype, file extension)
+    "gzip": ("application/gzip", ".gz"),
+    "zstd": ("application/zstd", ".zst"),
+    "none": ("application/json", ""),
+}
+
+
+class BackupError(ValueError):
+    """Raised when an uploaded backup cannot be decoded or validated"""
+
+
+def compress_chunks(chunks, compression):
+    """Compress an iterable of byte chunks, yielding compressed chunks as they are produced"""
+    if compression == "none":
+        yield from chunks
+        return
+
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    elif compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        raise BackupError(f"Unsupported compression '{compression}'")
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_file_chunks(path, delete_after=False):
+    """Yield a file's contents in fixed-size chunks, optionally removing it afterwards"""
+    try:
+        with open(path, "rb") as handle:
+            while True:
+                chunk = handle.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if delete_after:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# zstd's decompressobj cannot cap its output, but a block (at most 128 KiB once
+# inflated) takes at least 4 bytes of input, so feeding it this many bytes at a
+# time keeps every call under 8 MiB however the input was crafted
+ZSTD_INPUT_SLICE = 256
+
+
+def _inflate_zlib(decompressor, chunk):
+    """Decompress one input chunk in pieces of at most CHUNK_SIZE bytes"""
+    while chunk and not decompressor.eof:
+        yield decompressor.decompress(chunk, CHUNK_SIZE)
+        chunk = decompressor.unconsumed_tail
+
+
+def _inflate_zstd(decompressor, chunk):
+    """Decompress one input chunk ZSTD_INPUT_SLICE bytes at a time"""
+    for offset in range(0, len(chunk), ZSTD_INPUT_SLICE):
+        if decompressor.eof:
+            break
+        yield decompressor.decompress(chunk[offset:offset + ZSTD_INPUT_SLICE])
+
+
+def _pass_through(decompressor, chunk):
+    yield chunk
+
+
+def decompress_stream(stream):
+    """
+    Yield the decompressed contents of a file-like object.
+
+    The compression is detected from the magic bytes, so gzip, zstd and
+    plain JSON uploads are all accepted. Output is produced in bounded pieces
+    and counted against MAX_RESTORE_BYTES as it is inflated, so a small
+    "decompression bomb" is refused before it can fill memory.
+    """
+    head = stream.read(CHUNK_SIZE)
+    if head.startswith(GZIP_MAGIC):
+        decompressor = zlib.decompressobj(47)  # 32 + 15: auto-detect gzip/zlib headers
+        inflate = _inflate_zlib
+    elif head.startswith(ZSTD_MAGIC):
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        inflate = _inflate_zstd
+    else:
+        decompressor = None
+        inflate = _pass_through
+
+    total = 0
+    chunk = head
+    while chunk:
+        try:
+            for data in inflate(decompressor, chunk):
+                total += len(data)
+                if total > MAX_RESTORE_BYTES:
+                    raise BackupError(f"Backup exceeds the {MAX_RESTORE_BYTES} byte restore limit")
+                if data:
+                    yield data
+        except (zlib.error, zstandard.ZstdError) as e:
+            raise BackupError(f"Corrupt compressed backup: {str(e)}")
+        chunk = stream.read(CHUNK_SIZE)
+
+    if decompressor is not None:
+        # A stream cut short (e.g. a gzip file missing its CRC and size trailer) never reaches EOF
+        if not decompressor.eof:
+            raise BackupError("Compressed backup is truncated")
+        if hasattr(decompressor, "flush"):
+            data = decompressor.flush()
+            if data:
+                yield data
+
+
+def is_changes_stream(head):
+    """True if the (decompressed) start of a backup is an incremental changes stream"""
+    first_line = head.split(b"\n", 1)[0]
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        return False
+    return isinstance(header, dict) and header.get("format") == CHANGES_FORMAT
+
+
+def load_database_file(path):
+    """Load and validate a TinyDB JSON file, returning its contents"""
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise BackupError(f"Backup is not valid JSON: {str(e)}")
+
+    if not isinstance(data, dict):
+        raise BackupError("Backup must be a JSON object of tables")
+    for table_name, table in data.items():
+        if not isinstance(table, dict):
+            raise BackupError(f"Table '{table_name}' must be a JSON object")
+        for doc_id, document in table.items():
+            if not str(doc_id).isdigit():
+                raise BackupError(f"Invalid document id '{doc_id}' in table '{table_name}'")
+            if not isinstance(document, dict):
+                raise BackupError(f"Document {doc_id} in table '{table_name}' must be a JSON object")
+    return data
+
+
+def parse_changes(chunks):
+    """Parse an incremental backup stream into (header, entries)"""
+    lines = b"".join(chunks).splitlines()
+    try:
+        header = json.loads(lines[0])
+        entries = [json.loads(line) for line in lines[1:] if line.strip()]
+    except (ValueError, IndexError) as e:
+        raise BackupError(f"Invalid changes stream: {str(e)}")
+
+    if not isinstance(header, dict) or header.get("format") != CHANGES_FORMAT:
+        raise BackupError("Missing changes stream header")
+    expected = header.get("since")
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("op") not in ("upsert", "remove"):
+            raise BackupError("Invalid change entry")
+        if not isinstance(expected, int) or entry.get("v") != expected + 1:
+            raise BackupError("Change entries are not consecutive")
+        expected = entry["v"]
+    if expected != header.get("version"):
+        raise BackupError("Changes stream is truncated")
+    return header, entries
+
+
+def apply_changes(table, entries):
+    """Apply journal entries to a raw TinyDB table dict (doc id strings -> documents)"""
+    for entry in entries:
+        if entry["op"] == "upsert":
+            for doc_id, document in entry["docs"].items():
+                table[str(doc_id)] = document
+        else:
+            for doc_id in entry["ids"]:
+                table.pop(str(doc_id), None)
+    return table
+
+
+class ProcessLock:
+    """
+    Reentrant lock shared by the threads of this process and, through flock()
+    on `path`, by every other process (e.g. gunicorn worker) using the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._handle = None
+        self._pid = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            # A forked worker must not share the parent's open file (and with it the lock)
+            try:
+                if self._pid != os.getpid():
+                    self._handle = open(self.path, "a")
+                    self._pid = os.getpid()
+                fcntl.flock(self._handle, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ChangeJournal:
+    """
+    Append-only JSON-lines log of writes to the bills table.
+
+    The first line is a header holding the journal epoch (a random id that
+    changes whenever history is discarded, e.g. on a full restore) and the
+    floor version (the oldest version incremental backups can start from).
+    Every following line is one write tagged with the version it produced.
+
+    Several processes can share one journal: `lock` (a ProcessLock) must be
+    held around every write, and a writer calls sync() first to pick up the
+    versions other processes have added, so numbers stay consecutive.
+    """
+
+    def __init__(self, path, max_entries=10000, lock=None):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = lock or threading.RLock()
+        self.epoch = None
+        self.floor = 0
+        self.version = 0
+        self._entries = 0
+        self._offset = 0    # end of the last line this process has read or written
+        self._seen = None   # (inode, size, mtime) of the file at that point
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            self.reset(version=0)
+            return
+
+        try:
+            with open(self.path, "rb") as handle:
+                self._read_header(handle)
+                self._read_entries(handle)
+        except (ValueError, KeyError, TypeError):
+            print(f"Warning: change journal '{self.path}' is unreadable, starting a new one")
+            self.reset(version=self.version)
+
+    def _read_header(self, handle):
+        header = json.loads(handle.readline())
+        self.epoch = header["epoch"]
+        self.floor = self.version = header["floor"]
+        self._entries = 0
+
+    def _read_entries(self, handle):
+        """Read the entries from the handle's position to the end; returns those newer than self.version"""
+        entries = []
+        for line in handle:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            self._entries += 1
+            if entry["v"] > self.version:
+                self.version = entry["v"]
+                entries.append(entry)
+        self._mark_seen(handle)
+        return entries
+
+    def _mark_seen(self, handle):
+        self._offset = handle.tell()
+        stat = os.fstat(handle.fileno())
+        self._seen = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def changed_on_disk(self):
+        """True if another process has written to the journal since this one last read it (one stat call)"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != self._seen
+
+    def sync(self):
+        """
+        Catch up with the entries other processes have appended, and return
+        them. If they cannot be replayed (another process restored a backup,
+        or compacted away entries this process never read) the journal is
+        reloaded and [{"v": version, "op": "reset"}] is returned instead.
+        """
+        with self._lock:
+            if not self.changed_on_disk():
+                return []
+            with open(self.path, "rb") as handle:
+                header = json.loads(handle.readline())
+                if header["epoch"] != self.epoch or header["floor"] > self.version:
+                    handle.seek(0)
+                    self._read_header(handle)
+                    self._read_entries(handle)
+                    return [{"v": self.version, "op": "reset"}]
+                self.floor = header["floor"]
+                if os.fstat(handle.fileno()).st_ino == self._seen[0]:
+                    handle.seek(self._offset)
+                else:
+                    # Compacted into a new file: skip what this process already has
+                    self._entries = 0
+                return self._read_entries(handle)
+
+    def _write_header(self, handle):
+        handle.write((json.dumps({"epoch": self.epoch, "floor": self.floor}) + "\n").encode("utf-8"))
+
+    def reset(self, version, epoch=None):
+        """Discard history and start a new epoch at the given version"""
+        with self._lock:
+            self.epoch = epoch or uuid.uuid4().hex
+            self.floor = self.version = version
+            self._entries = 0
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as handle:
+                self._write_header(handle)
+                handle.flush()
+                self._mark_seen(handle)
+            os.replace(tmp_path, self.path)
+
+    def append(self, op, payload):
+        """Record one write; returns the journal entry (tagged with the new store version)"""
+        with self._lock:
+            if self.changed_on_disk():
+                raise RuntimeError("The change journal was written by another process; sync() first")
+            entry = {"v": self.version + 1, "op": op}
+            entry.update(payload)
+            self.extend([entry])
+            return entry
+
+    def extend(self, entries):
+        """Append already-versioned entries (e.g. from an incremental restore)"""
+        with self._lock:
+            with open(self.path, "ab") as handle:
+                for entry in entries:
+                    handle.write((json.dumps(entry) + "\n").encode("utf-8"))
+                    self.version = entry["v"]
+                    self._entries += 1
+                handle.flush()
+                self._mark_seen(handle)
+            if self._entries > 2 * self.max_entries:
+                self._compact()
+
+    def _compact(self):
+        """Keep only the newest max_entries entries"""
+        with open(self.path, "rb") as handle:
+            handle.readline()
+            lines = [line for line in handle if line.strip()]
+        kept = lines[-self.max_entries:]
+        self.floor = json.loads(kept[0])["v"] - 1 if kept else self.version
+        self._entries = len(kept)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            self._write_header(handle)
+            handle.writelines(kept)
+            handle.flush()
+            self._mark_seen(handle)
+        os.replace(tmp_path, self.path)
+
+    def can_serve(self, since, epoch):
+        return epoch == self.epoch and self.floor <= since <= self.version
+
+    def iter_changes(self, since, until):
+        """
+        Yield the incremental backup stream for versions (since, until] as bytes.
+
+        The file is opened eagerly so a concurrent compaction (which replaces
+        the file) cannot pull entries out from under a running download.
+        """
+        handle = open(self.path, "rb")
+        header = {"format": CHANGES_FORMAT, "epoch": self.epoch, "since": since, "version": until}
+
+        def generate():
+            with handle:
+                yield (json.dumps(header) + "\n").encode("utf-8")
+                handle.readline()
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    version = json.loads(line)["v"]
+                    if version > until:
+                        break
+                    if version > since:
+                        yield line
+
+        return generate()
@@ -0,0 +1,710 @@
+"""
+Reproducible benchmark / load-testing harness for the BillTracker API.
+
+Generates a synthetic bill dataset of any size from a fixed seed (reusing the
+category and bill-name tables from sample_bills.py), loads it into a scratch
+TinyDB file, drives every endpoint and writes p50/p95/p99 latency, throughput
+and peak memory per endpoint to a JSON report that can be compared between
+commits. With --http the requests come from a separate client process, so the
+client's own work does not compete with the server for the GIL.
+
+Gemini and SMTP are replaced by local fakes so the suite runs fully offline.
+
+Usage:
+    python benchmark.py --bills 10000 --iterations 100 --output bench.json
+    python benchmark.py --bills 100000 --http --concurrency 8
+    python benchmark.py --bills 10000 --baseline bench.json
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --analytics --bills 100000 --iterations 5
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import gc
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sample_bills import make_sample_bill
+
+# Bills created by the write benchmarks get ids far above the generated dataset
+BENCH_ID_OFFSET = 10_000_000
+
+
+# ---------------------------------------------------------------------------
+# Local fakes for external services
+# ---------------------------------------------------------------------------
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel; answers instantly and deterministically"""
+
+    calls = 0
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        FakeGenerativeModel.calls += 1
+        if "categorization assistant" in prompt:
+            return FakeGeminiResponse("Utilities")
+        return FakeGeminiResponse(
+            "- Compare providers once a year.\n"
+            "- Cancel services you no longer use.\n"
+            "- Switch to annual billing where it is cheaper."
+        )
+
+
+class FakeMail:
+    """Stands in for flask_mail.Mail; keeps sent messages in memory"""
+
+    def __init__(self):
+        self.outbox = []
+
+    def send(self, message):
+        self.outbox.append(message)
+
+
+def install_fakes(billtracker):
+    billtracker.genai = types.SimpleNamespace(
+        GenerativeModel=FakeGenerativeModel,
+        configure=lambda **kwargs: None,
+    )
+    billtracker.mail = FakeMail()
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def generate_bills(count, seed, today=None):
+    """
+    Generate `count` realistic bills from a fixed seed.
+
+    Due dates are spread over the past year and the next month so that date
+    filtering endpoints (reminders, analytics) see a realistic mix.
+    """
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=365)
+    return [make_sample_bill(i, start, rng=rng, max_days_offset=395) for i in range(1, count + 1)]
+
+
+def load_dataset(billtracker, bills):
+    """Swap the dataset in through the app's restore path so journals and indexes stay in sync"""
+    fd, path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(billtracker.db_path)))
+    with os.fdopen(fd, "w") as handle:
+        json.dump({"_default": {str(i): bill for i, bill in enumerate(bills, start=1)}}, handle)
+    billtracker.restore_database_file(path)
+
+
+def sample_image_b64():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 32), color=(255, 255, 255)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+# ---------------------------------------------------------------------------
+# Endpoint catalogue
+# ---------------------------------------------------------------------------
+
+class Endpoint:
+    """
+    One benchmarked request.
+
+    `path` and `body` may be callables taking the request index so that write
+    endpoints touch a different bill on every call. `setup` receives the
+    number of requests that will be issued and prepares whatever they need.
+    """
+
+    def __init__(self, method, path, body=None, files=None, setup=None, teardown=None, name=None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.files = files
+        self.setup = setup
+        self.teardown = teardown
+        self.name = name or f"{method} {path if isinstance(path, str) else path(0)}"
+
+    def resolve(self, index):
+        path = self.path(index) if callable(self.path) else self.path
+        body = self.body(index) if callable(self.body) else self.body
+        files = self.files(index) if callable(self.files) else self.files
+        return path, body, files
+
+
+def build_endpoints(billtracker, bill_count):
+    from tinydb import Query
+
+    Bill = Query()
+    image = sample_image_b64()
+    existing_ids = max(bill_count, 1)
+
+    def bench_bill(index, prefix="Benchmark Bill"):
+        return {
+            "id": BENCH_ID_OFFSET + index,
+            "bill_name": f"{prefix} {index}",
+            "amount": 42.5,
+            "due_date": datetime.date.today().isoformat(),
+            "category": "Other",
+            "paid": False,
+            "status": "pending",
+            "notes": "Created by benchmark",
+            "recurring": False,
+        }
+
+    def seed_bills(prefix):
+        def setup(count):
+            billtracker.insert_bills(bench_bill(i, prefix) for i in range(count))
+        return setup
+
+    def remove_bench_bills():
+        billtracker.remove_bills(Bill.id >= BENCH_ID_OFFSET)
+
+    def db_file(index):
+        with open(billtracker.db_path, "rb") as handle:
+            return {"file": ("bills.json", handle.read())}
+
+    return [
+        Endpoint("GET", "/"),
+        Endpoint("GET", "/ping"),
+        Endpoint("GET", "/bills"),
+        Endpoint("GET", lambda i: f"/bills/{i % existing_ids + 1}", name="GET /bills/<id>"),
+        Endpoint("POST", "/bills", body=lambda i: bench_bill(i),
+                 teardown=remove_bench_bills),
+        Endpoint("PUT", lambda i: f"/bills/{i % existing_ids + 1}", name="PUT /bills/<id>",
+                 body=lambda i: {"notes": f"Updated by benchmark {i}"}),
+        Endpoint("DELETE", lambda i: f"/bills?id={BENCH_ID_OFFSET + i}", name="DELETE /bills?id=<id>",
+                 setup=seed_bills("Benchmark Delete"), teardown=remove_bench_bills),
+        Endpoint("DELETE", "/bills/by-name", body=lambda i: {"bill_name": f"Benchmark Named {i}"},
+                 setup=seed_bills("Benchmark Named"), teardown=remove_bench_bills),
+        Endpoint("GET", "/bills?days=365"),
+        Endpoint("GET", "/bills/search?q=electrcity+bil"),
+        Endpoint("GET", "/reminders"),
+        Endpoint("GET", "/insights"),
+        Endpoint("GET", "/insights?days=365"),
+        Endpoint("GET", "/analytics/timeseries?granularity=week&expand=true"),
+        Endpoint("POST", "/ai-query",
+                 body={"query": "How much do I spend on my internet bill?"}),
+        Endpoint("POST", "/classify-bill", body={"bill_name": "Electricity Bill"}),
+        Endpoint("GET", "/admin/categorize-all-bills"),
+        Endpoint("GET", "/free-alternatives"),
+        Endpoint("GET", "/average-spending"),
+        Endpoint("GET", "/category-comparison"),
+        Endpoint("POST", "/send-reminder", body={
+            "email": "bench@example.com",
+            "bill_name": "Electricity Bill",
+            "due_date": datetime.date.today().isoformat(),
+            "amount": 80,
+        }),
+        Endpoint("POST", "/extract-bill-data", body={"image": image}),
+        Endpoint("GET", "/api/download-db"),
+        Endpoint("GET", "/api/download-db?compression=zstd"),
+        Endpoint("GET", lambda i: f"/api/download-db?since={billtracker.journal.version - 10}",
+                 name="GET /api/download-db?since=<v>"),
+        Endpoint("POST", "/api/upload-db", files=db_file),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Request drivers
+# ---------------------------------------------------------------------------
+
+class TestClientDriver:
+    """Issues requests in-process through Flask's test client"""
+
+    mode = "test_client"
+    client_process = False
+
+    def __init__(self, flask_app, headers=None):
+        self.client = flask_app.test_client()
+        self.headers = headers or {}
+
+    def request(self, endpoint, index):
+        path, body, files = endpoint.resolve(index)
+        kwargs = {"headers": self.headers}
+        if files:
+            kwargs["data"] = {key: (io.BytesIO(content), filename) for key, (filename, content) in files.items()}
+            kwargs["content_type"] = "multipart/form-data"
+        elif body is not None:
+            kwargs["json"] = body
+        response = self.client.open(path, method=endpoint.method, **kwargs)
+        response.get_data()
+        return response.status_code
+
+    def timed_requests(self, endpoint, indexes, concurrency):
+        """Time one request per index; returns ([(seconds, status)], elapsed seconds)"""
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda i: timed_request(self, endpoint, i), indexes))
+        else:
+            samples = [timed_request(self, endpoint, i) for i in indexes]
+        return samples, time.perf_counter() - started
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    """
+    Issues requests over real HTTP against a threaded werkzeug server.
+
+    The server runs in this process (so tracemalloc sees its allocations) while
+    the requests are sent and timed by a separate client process; requests are
+    resolved here and handed over already encoded.
+    """
+
+    mode = "http"
+    client_process = True
+
+    # Requests resolved ahead of the client; bounded so large upload bodies do not pile up
+    QUEUE_SIZE = 16
+
+    def __init__(self, flask_app, headers=None, host="127.0.0.1", port=0):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server(host, port, flask_app, threaded=True, request_handler=QuietHandler)
+        self.base_url = f"http://{host}:{self.server.server_port}"
+        self.headers = headers or {}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        # Spawned rather than forked: this process already runs the server thread
+        context = multiprocessing.get_context("spawn")
+        self.jobs = context.Queue(maxsize=self.QUEUE_SIZE)
+        self.results = context.Queue()
+        self.client = context.Process(target=http_client, args=(self.base_url, self.jobs, self.results),
+                                      daemon=True)
+        self.client.start()
+
+    def prepare(self, endpoint, index):
+        """Resolve and encode one request into a picklable (method, url, data, headers) tuple"""
+        path, body, files = endpoint.resolve(index)
+        headers = dict(self.headers)
+        data = None
+        if files:
+            boundary = uuid.uuid4().hex
+            data = encode_multipart(files, boundary)
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        elif body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        return endpoint.method, self.base_url + path, data, headers
+
+    def request(self, endpoint, index):
+        samples, _ = self.timed_requests(endpoint, [index], 1)
+        return samples[0][1]
+
+    def timed_requests(self, endpoint, indexes, concurrency):
+        """Have the client process time one request per index; returns ([(seconds, status)], elapsed seconds)"""
+        self._send(concurrency)
+        for index in indexes:
+            self._send(self.prepare(endpoint, index))
+        for _ in range(concurrency):
+            self._send(None)
+        while True:
+            try:
+                return self.results.get(timeout=1)
+            except queue.Empty:
+                self._check_client()
+
+    def _send(self, job):
+        while True:
+            try:
+                self.jobs.put(job, timeout=1)
+                return
+            except queue.Full:
+                self._check_client()
+
+    def _check_client(self):
+        if not self.client.is_alive():
+            raise RuntimeError(f"HTTP client process exited with code {self.client.exitcode}")
+
+    def close(self):
+        if self.client.is_alive():
+            self.jobs.put(None)
+            self.client.join(timeout=10)
+        self.server.shutdown()
+
+
+def http_client(base_url, jobs, results):
+    """
+    Client process behind HTTPDriver.
+
+    Each batch on `jobs` is a concurrency level, then the prepared requests,
+    then one None per client thread; a None in place of a batch stops the
+    process. The timings of each batch go back on `results`.
+    """
+    def client_thread():
+        return [timed_http_request(prepared) for prepared in iter(jobs.get, None)]
+
+    for concurrency in iter(jobs.get, None):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            threads = [pool.submit(client_thread) for _ in range(concurrency)]
+        samples = [sample for thread in threads for sample in thread.result()]
+        results.put((samples, time.perf_counter() - started))
+
+
+def timed_http_request(prepared):
+    method, url, data, headers = prepared
+    start = time.perf_counter()
+    try:
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+    except Exception as e:
+        print(f"Error calling {method} {url}: {str(e)}")
+        status = "error"
+    return time.perf_counter() - start, status
+
+
+def encode_multipart(files, boundary):
+    parts = []
+    for field, (filename, content) in files.items():
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode("utf-8")
+        )
+        parts.append(content)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def timed_request(driver, endpoint, index):
+    start = time.perf_counter()
+    try:
+        status = driver.request(endpoint, index)
+    except Exception as e:
+        print(f"Error calling {endpoint.name}: {str(e)}")
+        status = "error"
+    return time.perf_counter() - start, status
+
+
+def run_endpoint(driver, endpoint, iterations, warmup, concurrency):
+    # One extra request is reserved for the memory measurement pass
+    total = warmup + iterations + 1
+    if endpoint.setup:
+        endpoint.setup(total)
+
+    try:
+        for index in range(warmup):
+            driver.request(endpoint, index)
+
+        samples, elapsed = driver.timed_requests(endpoint, range(warmup, warmup + iterations), concurrency)
+
+        # Peak memory is measured on a separate request so tracing does not skew latency
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        driver.request(endpoint, warmup + iterations)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if endpoint.teardown:
+            try:
+                endpoint.teardown()
+            except Exception as e:
+                print(f"Error cleaning up after {endpoint.name}: {str(e)}")
+
+    latencies = sorted(duration for duration, _ in samples)
+    status_codes = {}
+    for _, status in samples:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+    errors = sum(count for status, count in status_codes.items() if not status.isdigit() or int(status) >= 500)
+
+    return {
+        "method": endpoint.method,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "status_codes": status_codes,
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(iterations / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_memory_kb": round(max(0, peak - before) / 1024, 1),
+    }
+
+
+def max_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def current_rss_kb():
+    """Resident set size right now (Linux); falls back to the peak elsewhere"""
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (OSError, ValueError, IndexError):
+        return max_rss_kb()
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------
+
+def compare_reports(old, new):
+    """Print per-endpoint deltas between two benchmark reports"""
+    print(f"{'endpoint':<34} {'p50 ms':>18} {'p95 ms':>18} {'rps':>18} {'peak KB':>18}")
+    for name, result in new["results"].items():
+        previous = old["results"].get(name)
+        if "error" in result or (previous and "error" in previous):
+            print(f"{name:<34} (failed)")
+            continue
+        if not previous:
+            print(f"{name:<34} (new)")
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput_rps", "peak_memory_kb"):
+            before, after = previous.get(key, 0), result.get(key, 0)
+            change = ((after - before) / before * 100) if before else 0.0
+            cells.append(f"{after:>9.2f} ({change:+6.1f}%)")
+        print(f"{name:<34} " + " ".join(cells))
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Point the app at a throwaway database file (must be entered before importing app)"""
+    scratch_dir = tempfile.mkdtemp(prefix="billtracker-bench-")
+    os.environ["DB_PATH"] = os.path.join(scratch_dir, "bills.json")
+    try:
+        yield
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def run_analytics(args):
+    """Compare the vectorised time series against the pure-Python loop on a synthetic dataset"""
+    from tinydb.table import Document
+
+    from analytics import timeseries, timeseries_python
+    from fields import parse_date
+    from snapshot import BillSnapshot
+
+    bills = [Document(bill, doc_id=bill["id"]) for bill in generate_bills(args.bills, args.seed)]
+    dates = [parse_date(bill["due_date"]) for bill in bills]
+    start, end = min(dates), max(dates)
+
+    started = time.perf_counter()
+    columns = BillSnapshot.from_table({bill.doc_id: bill for bill in bills})
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"Built snapshot for {len(bills)} bills in {build_ms:.1f}ms")
+
+    results = {"build_snapshot_ms": round(build_ms, 3)}
+    for granularity in ("day", "week", "month"):
+        timings = {}
+        for name, compute in (
+            ("numpy", lambda: timeseries(columns, granularity, start, end)),
+            ("python", lambda: timeseries_python(bills, granularity, start, end)),
+        ):
+            samples = []
+            for _ in range(max(1, args.iterations)):
+                t0 = time.perf_counter()
+                output = compute()
+                samples.append(time.perf_counter() - t0)
+            timings[name] = (sorted(samples), output)
+
+        numpy_output, python_output = timings["numpy"][1], timings["python"][1]
+        matches = all(
+            numpy_output[key] == python_output[key] for key in ("periods", "bill_count")
+        ) and all(
+            max((abs(a - b) for a, b in zip(numpy_output[key], python_output[key])), default=0) < 0.011
+            for key in ("total", "paid", "pending", "rolling_average")
+        )
+        numpy_p50 = percentile(timings["numpy"][0], 50) * 1000
+        python_p50 = percentile(timings["python"][0], 50) * 1000
+        results[granularity] = {
+            "numpy_p50_ms": round(numpy_p50, 3),
+            "python_p50_ms": round(python_p50, 3),
+            "speedup": round(python_p50 / numpy_p50, 1) if numpy_p50 else None,
+            "results_match": matches,
+        }
+        print(f"{granularity:<6} numpy={numpy_p50:>9.3f}ms python={python_p50:>9.3f}ms "
+              f"speedup={results[granularity]['speedup']}x match={matches}")
+
+    report = {
+        "meta": {
+            "commit": current_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "bills": args.bills,
+            "seed": args.seed,
+            "iterations": args.iterations,
+        },
+        "analytics": results,
+    }
+    with open(args.output, "w") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Report written to {args.output}")
+
+
+def run(args):
+    with scratch_database():
+        import app as billtracker
+
+        install_fakes(billtracker)
+        # Measure the endpoints themselves unless asked to include the rate limiter
+        billtracker.limiter.enabled = args.rate_limits
+
+        generate_started = time.perf_counter()
+        bills = generate_bills(args.bills, args.seed)
+        load_dataset(billtracker, bills)
+        del bills
+        setup_seconds = time.perf_counter() - generate_started
+        print(f"Loaded {args.bills} bills (seed={args.seed}) in {setup_seconds:.2f}s")
+
+        headers = {"Accept-Encoding": args.accept_encoding} if args.accept_encoding else None
+        driver = (HTTPDriver if args.http else TestClientDriver)(billtracker.app, headers=headers)
+        gc.collect()
+        rss_after_load = current_rss_kb()
+        results = {}
+        try:
+            for endpoint in build_endpoints(billtracker, args.bills):
+                if args.endpoints and endpoint.name not in args.endpoints \
+                        and not any(f.endswith("*") and endpoint.name.startswith(f[:-1]) for f in args.endpoints):
+                    continue
+                try:
+                    result = run_endpoint(driver, endpoint, args.iterations, args.warmup, args.concurrency)
+                except Exception as e:
+                    # A broken endpoint (or a store it corrupted) should not abort the whole run
+                    print(f"{endpoint.name:<34} failed: {str(e)}")
+                    results[endpoint.name] = {"method": endpoint.method, "error": str(e)}
+                    continue
+                results[endpoint.name] = result
+                print(f"{endpoint.name:<34} p50={result['p50_ms']:>9.3f}ms p95={result['p95_ms']:>9.3f}ms "
+                      f"p99={result['p99_ms']:>9.3f}ms {result['throughput_rps']:>9.2f} rps "
+                      f"peak={result['peak_memory_kb']:>9.1f}KB")
+        finally:
+            driver.close()
+        gc.collect()
+
+        report = {
+            "meta": {
+                "commit": current_commit(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "mode": driver.mode,
+                "client_process": driver.client_process,
+                "bills": args.bills,
+                "seed": args.seed,
+                "iterations": args.iterations,
+                "warmup": args.warmup,
+                "concurrency": args.concurrency,
+                "accept_encoding": args.accept_encoding,
+                "setup_seconds": round(setup_seconds, 3),
+                "rss_after_load_kb": rss_after_load,
+                "rss_after_run_kb": current_rss_kb(),
+                "max_rss_kb": max_rss_kb(),
+                "rate_limits": args.rate_limits,
+                "gemini_calls": FakeGenerativeModel.calls,
+            },
+            "results": results,
+        }
+
+    with open(args.output, "w") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            compare_reports(json.load(handle), report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BillTracker API on synthetic data")
+    parser.add_argument("--bills", type=int, default=1000, help="number of synthetic bills to generate")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the dataset")
+    parser.add_argument("--iterations", type=int, default=50, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel clients per endpoint")
+    parser.add_argument("--http", action="store_true", help="drive a real HTTP server instead of the test client")
+    parser.add_argument("--accept-encoding", help="Accept-Encoding header to send (e.g. 'br, gzip')")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep the per-client rate limits on (requests over the limit show up as 429s)")
+    parser.add_argument("--endpoints", nargs="*", help="only run these endpoints (exact names; a trailing * matches a prefix)")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="previous report to compare this run against")
+    parser.add_argument("--analytics", action="store_true",
+                        help="benchmark the time-series aggregation (NumPy vs pure Python) instead of the endpoints")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="only compare two existing reports")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare_reports(json.load(old), json.load(new))
+        return
+
+    if args.analytics:
+        run_analytics(args)
+        return
+
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Coercion of stored bill fields into the values the indexes compute with.
+
+Bills keep whatever clients sent: due dates in several formats, amounts as
+numbers, numeric strings or nothing at all. The snapshot, the recurrence index
+and the analytics all read them through these helpers, so they agree on what
+a bill's date and amount are.
+"""
+from datetime import date, datetime
+
+import numpy as np
+
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d']
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_date(value):
+    """Parse a bill date in any of the formats the app accepts; None if it cannot be parsed"""
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+    if len(text) == 10 and text[4] == '-':
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    # Handle ISO format with or without timezone
+    if 'T' in text:
+        try:
+            return datetime.strptime(text.split('T')[0], '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return None
+
+
+def to_day(value):
+    """Days since 1970-01-01 (NumPy's datetime64[D] representation) for a date"""
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_day(day):
+    """Inverse of to_day"""
+    return date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+def days_to_iso(days):
+    """Vectorised days-since-epoch -> 'YYYY-MM-DD' strings"""
+    return np.datetime_as_string(np.asarray(days, dtype='int64').astype('datetime64[D]'), unit='D')
+
+
+def parse_amount(bill):
+    """A bill's amount as a float; 0.0 if it is missing or not a number"""
+    try:
+        return float(bill.get('amount', 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,263 @@
+"""
+Rate limiting, concurrency limits and request coalescing for expensive endpoints.
+
+State lives in a small SQLite database, so every gunicorn worker (and every
+thread inside one) shares the same counters:
+
+- token buckets per endpoint and client: `per_minute` requests on average with
+  bursts of up to `burst`; a client with an empty bucket gets a 429
+- concurrency slots per endpoint: at most `concurrency` requests run at once,
+  the rest wait up to `queue_timeout` seconds for a slot and then get a 503
+- single flight: an upstream call (e.g. a Gemini prompt) that is identical to
+  one already running waits for that call's result instead of repeating it
+
+Slots and flights left behind by a crashed worker expire after `stale_after`
+seconds. A held slot is refreshed well within that time, so a request that runs
+longer (e.g. categorising every bill) keeps its slot.
+"""
+import contextlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    holder TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    acquired REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slots_by_name ON slots (name);
+CREATE TABLE IF NOT EXISTS flights (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS flights_by_key ON flights (key, finished);
+"""
+
+# Finished flights are kept this long so every waiting request can collect the result
+FLIGHT_RESULT_TTL = 30
+
+# Buckets untouched for this long are full again and can be dropped
+BUCKET_IDLE_SECONDS = 3600
+
+
+class LimitExceeded(Exception):
+    """Raised when a request is refused; carries the HTTP status and a Retry-After hint in seconds"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class UpstreamError(Exception):
+    """The call a coalesced request was waiting on failed"""
+
+
+class Limit:
+    def __init__(self, per_minute, burst, concurrency, queue_timeout=5.0):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+
+
+class LimiterStore:
+    """SQLite-backed buckets, slots and flights shared by all processes using the same file"""
+
+    def __init__(self, path, stale_after=300):
+        self.path = path
+        self.stale_after = stale_after
+        self._local = threading.local()
+        self._bucket_calls = 0
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork (e.g. gunicorn --preload)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def take_token(self, key, rate, burst):
+        """Take one token from a bucket refilling at `rate` per second; returns 0, or the seconds until one is available"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens >= 1:
+                tokens, wait = tokens - 1, 0.0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            self._bucket_calls += 1
+            if self._bucket_calls % 1000 == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - BUCKET_IDLE_SECONDS,))
+        return wait
+
+    def acquire_slot(self, name, limit):
+        """Hold one of `limit` slots for `name`; returns the holder id, or None if all are taken"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slots WHERE acquired < ?", (now - self.stale_after,))
+            (held,) = conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()
+            if held >= limit:
+                return None
+            holder = uuid.uuid4().hex
+            conn.execute("INSERT INTO slots (holder, name, acquired) VALUES (?, ?, ?)", (holder, name, now))
+        return holder
+
+    def refresh_slot(self, holder):
+        self._connect().execute("UPDATE slots SET acquired = ? WHERE holder = ?", (time.time(), holder))
+
+    def release_slot(self, holder):
+        self._connect().execute("DELETE FROM slots WHERE holder = ?", (holder,))
+
+    def join_flight(self, key):
+        """(flight id, True) if the caller should make the call, or (id of the running flight, False)"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM flights WHERE finished < ? OR (finished IS NULL AND started < ?)",
+                         (now - FLIGHT_RESULT_TTL, now - self.stale_after))
+            row = conn.execute("SELECT id FROM flights WHERE key = ? AND finished IS NULL", (key,)).fetchone()
+            if row is not None:
+                return row[0], False
+            flight_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO flights (id, key, started) VALUES (?, ?, ?)", (flight_id, key, now))
+        return flight_id, True
+
+    def finish_flight(self, flight_id, result=None, error=None):
+        self._connect().execute(
+            "UPDATE flights SET finished = ?, result = ?, error = ? WHERE id = ?",
+            (time.time(), json.dumps(result), error, flight_id),
+        )
+
+    def flight_outcome(self, flight_id):
+        """None while the flight runs, else (result, error); raises KeyError if it expired"""
+        row = self._connect().execute(
+            "SELECT finished, result, error FROM flights WHERE id = ?", (flight_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(flight_id)
+        if row[0] is None:
+            return None
+        return json.loads(row[1]), row[2]
+
+
+class _Slot:
+    """A held concurrency slot, with a heartbeat that keeps it from being expired as stale"""
+
+    def __init__(self, store, holder):
+        self.store = store
+        self.holder = holder
+        self._released = threading.Event()
+
+    def _heartbeat(self):
+        while not self._released.wait(self.store.stale_after / 3):
+            try:
+                self.store.refresh_slot(self.holder)
+            except sqlite3.Error as e:
+                print(f"Error refreshing rate limit slot: {str(e)}")
+
+    def __enter__(self):
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._released.set()
+        self.store.release_slot(self.holder)
+
+
+class Limiter:
+    """Applies per-endpoint Limits using a LimiterStore"""
+
+    def __init__(self, store, limits, enabled=True, poll_interval=0.05):
+        self.store = store
+        self.limits = limits
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+
+    def admit(self, name, client):
+        """
+        Admit one request from `client` to endpoint `name`, waiting for a free
+        slot if needed. Returns a context manager that holds the slot; raises
+        LimitExceeded (429 for the client's rate, 503 when the queue times out).
+        """
+        limit = self.limits.get(name)
+        if not self.enabled or limit is None:
+            return contextlib.nullcontext()
+
+        wait = self.store.take_token(f"{name}:{client}", limit.per_minute / 60.0, limit.burst)
+        if wait:
+            raise LimitExceeded(f"Rate limit exceeded for {name}, try again later", 429, wait)
+
+        deadline = time.monotonic() + limit.queue_timeout
+        delay = 0.01
+        while True:
+            holder = self.store.acquire_slot(name, limit.concurrency)
+            if holder is not None:
+                return _Slot(self.store, holder)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LimitExceeded(f"Too many concurrent {name} requests, try again later", 503,
+                                    limit.queue_timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.poll_interval)
+
+    def single_flight(self, key, compute, timeout=120):
+        """
+        compute(), unless an identical call (same key) is already running in any
+        worker, in which case its result is returned (or its error raised as
+        UpstreamError). Results must be JSON-serialisable.
+        """
+        flight_id, leader = self.store.join_flight(key)
+        if leader:
+            try:
+                result = compute()
+            except Exception as e:
+                self.store.finish_flight(flight_id, error=str(e) or type(e).__name__)
+                raise
+            self.store.finish_flight(flight_id, result=result)
+            return result
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                outcome = self.store.flight_outcome(flight_id)
+            except KeyError:
+                break
+            if outcome is not None:
+                result, error = outcome
+                if error is not None:
+                    raise UpstreamError(error)
+                return result
+            time.sleep(self.poll_interval)
+        # The call we were waiting on vanished (its worker died) or is stuck: make our own
+        return compute()
@@ -0,0 +1,288 @@
+"""
+Recurring bill expansion.
+
+A bill with `recurring: true` repeats from its due_date. The optional
+`recurrence` field picks the rule; bills that are only flagged repeat monthly:
+
+    {"freq": "monthly", "interval": 1, "until": "2026-12-31", "count": 12}
+
+`freq` is one of daily, weekly, monthly or yearly; `interval` skips periods
+(interval 2 + weekly = every other week); `until` and `count` optionally end
+the series. Monthly and yearly occurrences keep the anchor's day of month,
+clamped to the month length (a bill due on the 31st falls on Feb 28/29).
+
+Occurrences are never stored. RecurrenceIndex keeps one row per recurring bill
+in NumPy arrays and computes which occurrences fall into a date window
+arithmetically, so expanding a year of 10k bills does not loop over bills or
+months in Python.
+"""
+import threading
+
+import numpy as np
+
+from fields import parse_amount, parse_date, to_day
+
+# freq -> (steps in months?, base step)
+FREQUENCIES = {
+    "daily": (False, 1),
+    "weekly": (False, 7),
+    "monthly": (True, 1),
+    "yearly": (True, 12),
+}
+
+# Stand-in for "no limit" in the count/until arrays
+UNBOUNDED = np.iinfo(np.int64).max // 4
+
+
+_month_starts = np.zeros(1, dtype='int64')
+
+
+def _month_table(months):
+    """(first day, length in days) of each month, given as months since 1970-01"""
+    global _month_starts
+    low, high = int(months.min(initial=0)), int(months.max(initial=0))
+    if low < 0 or high + 2 > len(_month_starts):
+        if low < 0:
+            start = months.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+            end = (months + 1).astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+            return start, end - start
+        # Dates are converted once into a lookup table that grows as later months are queried
+        size = max(high + 2, 2 * len(_month_starts), 12 * 300)
+        _month_starts = np.arange(size).astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+    table = _month_starts
+    start = table[months]
+    return start, table[months + 1] - start
+
+
+class RecurrenceRule:
+    def __init__(self, freq="monthly", interval=1, until=None, count=None):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported recurrence frequency '{freq}' (use one of {', '.join(FREQUENCIES)})")
+        if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+            raise ValueError("Recurrence interval must be a positive integer")
+        if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count < 1):
+            raise ValueError("Recurrence count must be a positive integer")
+        if until is not None and parse_date(until) is None:
+            raise ValueError(f"Could not parse recurrence end date '{until}'")
+        self.freq = freq
+        self.interval = interval
+        self.until = parse_date(until)
+        self.count = count
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a rule from a bill's `recurrence` field (a dict, a frequency name, or empty for monthly)"""
+        if data in (None, True, ""):
+            return cls()
+        if isinstance(data, str):
+            return cls(freq=data)
+        if not isinstance(data, dict):
+            raise ValueError("recurrence must be an object like {\"freq\": \"monthly\"}")
+        unknown = set(data) - {"freq", "interval", "until", "count"}
+        if unknown:
+            raise ValueError(f"Unknown recurrence fields: {', '.join(sorted(unknown))}")
+        return cls(
+            freq=data.get("freq", "monthly"),
+            interval=data.get("interval", 1),
+            until=data.get("until"),
+            count=data.get("count"),
+        )
+
+    @classmethod
+    def for_bill(cls, bill):
+        """The bill's rule, or None if it does not recur (or its rule is invalid)"""
+        if not bill.get("recurring"):
+            return None
+        try:
+            return cls.from_dict(bill.get("recurrence"))
+        except ValueError as e:
+            print(f"Warning: ignoring invalid recurrence for bill '{bill.get('bill_name', 'Unnamed')}': {str(e)}")
+            return None
+
+    def to_dict(self):
+        data = {"freq": self.freq, "interval": self.interval}
+        if self.until is not None:
+            data["until"] = self.until.isoformat()
+        if self.count is not None:
+            data["count"] = self.count
+        return data
+
+
+def occurrence(bill, index, due_date):
+    """The bill as it appears at its `index`-th occurrence (0 is the stored bill itself)"""
+    if index == 0:
+        return bill
+    expanded = dict(bill)
+    expanded.update({
+        "due_date": due_date,
+        "paid": False,
+        "status": "pending",
+        "occurrence_of": bill.get("id"),
+        "occurrence": index,
+    })
+    return expanded
+
+
+class RecurrenceIndex:
+    """
+    Parallel arrays describing every recurring bill, kept up to date from the
+    change journal. Rows are edited in a dict and the arrays are rebuilt lazily
+    on the next query after a write.
+    """
+
+    FIELDS = ("doc_id", "anchor", "month_step", "day_step", "last_index", "until", "amount", "category")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._categories = {}
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._rows
+
+    def doc_ids(self):
+        """Doc ids of every indexed recurring bill"""
+        return self._get_arrays()["doc_id"]
+
+    def rebuild(self, table):
+        """Reindex from a raw TinyDB table (doc id -> document)"""
+        with self._lock:
+            self._rows = {}
+            self._arrays = None
+        for doc_id, bill in table.items():
+            self.update(int(doc_id), bill)
+
+    def update(self, doc_id, bill):
+        rule = RecurrenceRule.for_bill(bill)
+        anchor = parse_date(bill.get("due_date")) if rule else None
+        with self._lock:
+            self._arrays = None
+            if anchor is None:
+                self._rows.pop(doc_id, None)
+                return
+            in_months, base_step = FREQUENCIES[rule.freq]
+            step = base_step * rule.interval
+            amount = parse_amount(bill)
+            category = bill.get("category", "Other")
+            self._rows[doc_id] = (
+                doc_id,
+                to_day(anchor),
+                step if in_months else 0,
+                0 if in_months else step,
+                rule.count - 1 if rule.count is not None else UNBOUNDED,
+                to_day(rule.until) if rule.until is not None else UNBOUNDED,
+                amount,
+                self._categories.setdefault(category, len(self._categories)),
+            )
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._rows.pop(doc_id, None) is not None:
+                self._arrays = None
+
+    def _get_arrays(self):
+        with self._lock:
+            if self._arrays is None:
+                rows = list(self._rows.values())
+                columns = list(zip(*rows)) if rows else [()] * len(self.FIELDS)
+                arrays = {
+                    name: np.array(column, dtype='float64' if name == "amount" else 'int64')
+                    for name, column in zip(self.FIELDS, columns)
+                }
+                anchor = arrays["anchor"].astype('datetime64[D]')
+                anchor_month = anchor.astype('datetime64[M]')
+                arrays["anchor_month"] = anchor_month.astype('int64')
+                arrays["anchor_dom"] = (anchor - anchor_month.astype('datetime64[D]')).astype('int64')
+                self._arrays = arrays
+            return self._arrays
+
+    @staticmethod
+    def _dates_at(arrays, index, rows=None):
+        """Day number of occurrence `index` for each row (or for the given rows)"""
+        take = (lambda name: arrays[name]) if rows is None else (lambda name: arrays[name][rows])
+        month_step = take("month_step")
+        in_months = month_step > 0
+
+        # Day-based rules are a plain arithmetic progression
+        days = take("anchor") + index * take("day_step")
+        if not in_months.any():
+            return days
+
+        # Month-based rules keep the anchor's day of month, clamped to the month length
+        month = (take("anchor_month") + index * month_step)[in_months]
+        month_start, month_length = _month_table(month)
+        days[in_months] = month_start + np.minimum(take("anchor_dom")[in_months], month_length - 1)
+        return days
+
+    def _index_range(self, arrays, start, end):
+        """First and last occurrence index falling inside [start, end] for every row"""
+        start_day, end_day = to_day(start), to_day(end)
+        month_step, day_step = arrays["month_step"], arrays["day_step"]
+        in_months = month_step > 0
+        step = np.where(in_months, month_step, day_step)
+        last_day = np.minimum(arrays["until"], end_day)
+
+        start_month = np.datetime64(start, 'M').astype('int64')
+        end_month = (last_day.astype('datetime64[D]').astype('datetime64[M]')).astype('int64')
+        start_offset = np.where(in_months, start_month - arrays["anchor_month"], start_day - arrays["anchor"])
+        end_offset = np.where(in_months, end_month - arrays["anchor_month"], last_day - arrays["anchor"])
+
+        first = np.maximum(-(-start_offset // step), 0)
+        last = end_offset // step
+
+        # Day clamping can put the boundary month's occurrence just outside the window
+        first = first + ((self._dates_at(arrays, first) < start_day) & in_months)
+        last = last - ((self._dates_at(arrays, np.maximum(last, 0)) > last_day) & in_months & (last >= 0))
+        last = np.minimum(last, arrays["last_index"])
+        return first, last
+
+    def counts(self, start, end):
+        """(doc_ids, counts): how many occurrences each recurring bill has in [start, end]"""
+        arrays = self._get_arrays()
+        if not len(arrays["doc_id"]):
+            return arrays["doc_id"], arrays["doc_id"]
+        first, last = self._index_range(arrays, start, end)
+        return arrays["doc_id"], np.maximum(last - first + 1, 0)
+
+    def totals_by_category(self, start, end):
+        """Total amount due per category across all occurrences in [start, end]"""
+        arrays = self._get_arrays()
+        _, counts = self.counts(start, end)
+        if not len(counts):
+            return {}
+        size = len(self._categories)
+        totals = np.bincount(arrays["category"], weights=arrays["amount"] * counts, minlength=size)
+        occurrences = np.bincount(arrays["category"], weights=counts, minlength=size)
+        return {
+            name: float(totals[code])
+            for name, code in self._categories.items()
+            if occurrences[code] > 0
+        }
+
+    def expand(self, start, end, include_next=False):
+        """
+        Every occurrence in [start, end] as parallel arrays (doc_ids, indexes, days).
+
+        With include_next, bills with no occurrence in the window still
+        contribute their next one after `start` (if the series has not ended).
+        """
+        arrays = self._get_arrays()
+        empty = np.zeros(0, dtype='int64')
+        if not len(arrays["doc_id"]):
+            return empty, empty, empty
+        first, last = self._index_range(arrays, start, end)
+        counts = np.maximum(last - first + 1, 0)
+
+        if include_next:
+            next_day = self._dates_at(arrays, first)
+            has_next = (first <= arrays["last_index"]) & (next_day <= arrays["until"])
+            counts = np.where((counts == 0) & has_next, 1, counts)
+
+        rows = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        indexes = first[rows] + offsets
+        return arrays["doc_id"][rows], indexes, self._dates_at(arrays, indexes, rows)
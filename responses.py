@@ -0,0 +1,58 @@
+"""
+Helpers for compressing responses and validating cached copies.
+
+Bodies of at least MIN_COMPRESS_BYTES are sent with brotli or gzip, whichever
+the client's Accept-Encoding prefers. Read routes carry a strong ETag derived
+from the store version; every content coding gets its own suffix on that tag
+so compressed and uncompressed representations never share a validator.
+"""
+import os
+
+import brotli
+
+from backup import compress_chunks
+
+# Smaller bodies are not worth the CPU (and usually fit in one packet anyway)
+MIN_COMPRESS_BYTES = int(os.environ.get("MIN_COMPRESS_BYTES", 1024))
+
+# Brotli quality for dynamic responses: close to gzip's speed, noticeably smaller
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+# Preferred order when the client accepts several codings equally
+CONTENT_CODINGS = ("br", "gzip")
+
+
+def negotiate_coding(accept_encodings):
+    """The content coding to answer with (None for identity), from a parsed Accept-Encoding"""
+    return accept_encodings.best_match(CONTENT_CODINGS)
+
+
+def encode_body(data, coding):
+    if coding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return b"".join(compress_chunks([data], "gzip"))
+    raise ValueError(f"Unsupported content coding '{coding}'")
+
+
+def coded_etag(etag, coding):
+    """The ETag of the representation sent with a content coding"""
+    return f"{etag}-{coding}" if coding else etag
+
+
+def matching_etag(if_none_match, etag):
+    """
+    The tag from If-None-Match that names the current version in any content
+    coding (so a 304 repeats exactly what the client has cached), or None.
+    If-None-Match uses weak comparison (RFC 7232 3.2), so W/"..." tags, as
+    sent back through proxies that weaken ETags when they recompress, match too.
+    """
+    if if_none_match.star_tag:
+        return etag
+    for coding in (None,) + CONTENT_CODINGS:
+        candidate = coded_etag(etag, coding)
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
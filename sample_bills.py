@@ -0,0 +1,62 @@
+"""
+Sample bills for the demo database and the benchmark.
+
+Only builds bill dicts; opening the database and inserting them is app.py's
+job, so the benchmark can generate datasets without importing the app.
+"""
+import random
+from datetime import timedelta
+
+# Categories for bills
+BILL_CATEGORIES = ["Utilities", "Entertainment", "Subscriptions",
+                   "Insurance", "Rent", "Transportation", "Food", "Other"]
+
+# Sample bill names for each category
+SAMPLE_BILL_NAMES = {
+    "Utilities": ["Electricity Bill", "Water Bill", "Gas Bill", "Internet Service"],
+    "Entertainment": ["Netflix", "Disney+", "HBO Max", "Movie Tickets"],
+    "Subscriptions": ["Spotify Premium", "Adobe Creative Cloud", "Microsoft 365", "Amazon Prime"],
+    "Insurance": ["Health Insurance", "Car Insurance", "Renters Insurance", "Life Insurance"],
+    "Rent": ["Apartment Rent", "Storage Unit", "Parking Space"],
+    "Transportation": ["Car Payment", "Bus Pass", "Uber/Lyft", "Fuel"],
+    "Food": ["Grocery Store", "DoorDash", "Hello Fresh", "Restaurant Bills"],
+    "Other": ["Gym Membership", "Phone Bill", "Student Loans", "Credit Card"]
+}
+
+def make_sample_bill(bill_id, today, rng=random, max_days_offset=30):
+    """Build one realistic random bill; pass a seeded random.Random for reproducible data"""
+    # Choose random category
+    category = rng.choice(BILL_CATEGORIES)
+    
+    # Choose random bill name from that category
+    bill_name = rng.choice(SAMPLE_BILL_NAMES[category])
+    
+    # Determine amount based on category
+    if category == "Rent":
+        amount = round(rng.uniform(800, 2500), 2)
+    elif category == "Insurance":
+        amount = round(rng.uniform(80, 300), 2)
+    elif category == "Subscriptions":
+        amount = round(rng.uniform(5, 30), 2)
+    else:
+        amount = round(rng.uniform(15, 200), 2)
+        
+    # Generate due date within the next max_days_offset days
+    days_offset = rng.randint(1, max_days_offset)
+    due_date = today + timedelta(days=days_offset)
+    due_date_str = due_date.strftime('%Y-%m-%d')
+    
+    # 30% chance the bill is already paid
+    paid = rng.random() < 0.3
+    
+    return {
+        "id": bill_id,
+        "bill_name": bill_name,
+        "amount": amount,
+        "due_date": due_date_str,
+        "category": category,
+        "paid": paid,
+        "status": "paid" if paid else "pending",
+        "notes": f"Sample {category.lower()} bill",
+        "recurring": category in ["Subscriptions", "Utilities", "Rent", "Insurance"]
+    }
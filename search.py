@@ -0,0 +1,249 @@
+"""
+Fuzzy bill search over bill_name and notes, backed by a trigram inverted index.
+
+Text is lowercased, stripped of accents and punctuation, and split into
+words; each word padded as "  word " contributes its three-letter substrings
+(so "Netflix" gives "  n", " ne", "net", ..., "ix "). Names score by trigram
+similarity, |query & name| / |query | name|, which tolerates typos and extra
+words ("netflix sub" vs "Netflix" is 0.67). Notes are longer, so they score by
+the share of the query's trigrams they contain, weighted below a name match.
+
+Bills are indexed by distinct text: bills that share a name (every month's
+rent, say) share one index entry, so a query scores each distinct name once.
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+FIELDS = ("bill_name", "notes")
+
+# Default minimum score for search results (the same default as PostgreSQL's pg_trgm)
+DEFAULT_THRESHOLD = 0.3
+
+# A note containing every trigram of the query scores like a name with this similarity
+NOTES_WEIGHT = 0.6
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Lowercase, accent-free text with punctuation collapsed to single spaces"""
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_WORD.sub(" ", stripped.casefold()).strip()
+
+
+def trigrams(text):
+    """Set of padded word trigrams of already normalised text"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class BillSearchIndex:
+    """
+    Trigram index over the distinct bill_name and notes texts, kept up to date
+    from the change journal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._term_ids = {}      # normalised text -> term id
+            self._terms = []         # term id -> normalised text (None once unused)
+            self._free = []          # term ids available for reuse
+            self._sizes = np.zeros(64, dtype='int32')  # trigrams per term
+            self._counts = {field: np.zeros(64, dtype='int32') for field in FIELDS}  # docs per term and field
+            self._postings = {}      # trigram -> set of term ids
+            self._arrays = {}        # trigram -> posting as a NumPy array (built on demand)
+            self._docs = {field: {} for field in FIELDS}  # field -> term id -> set of doc ids
+            self._doc_terms = {}     # doc id -> term id per field
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    # -- maintenance ----------------------------------------------------------
+
+    def rebuild(self, table):
+        """Reindex from a raw TinyDB table (doc id -> document)"""
+        self.clear()
+        for doc_id, bill in table.items():
+            self.update(int(doc_id), bill)
+
+    def update(self, doc_id, bill):
+        with self._lock:
+            self._unlink(doc_id)
+            terms = []
+            for field in FIELDS:
+                text = normalize(bill.get(field))
+                if not text:
+                    terms.append(None)
+                    continue
+                term = self._term_ids.get(text)
+                if term is None:
+                    term = self._add_term(text)
+                self._docs[field].setdefault(term, set()).add(doc_id)
+                self._counts[field][term] += 1
+                terms.append(term)
+            self._doc_terms[doc_id] = tuple(terms)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._unlink(doc_id)
+
+    def _add_term(self, text):
+        grams = trigrams(text)
+        term = self._free.pop() if self._free else len(self._terms)
+        if term == len(self._terms):
+            self._terms.append(text)
+            if term >= len(self._sizes):
+                grow = lambda array: np.concatenate((array, np.zeros(len(array), dtype=array.dtype)))
+                self._sizes = grow(self._sizes)
+                self._counts = {field: grow(counts) for field, counts in self._counts.items()}
+        else:
+            self._terms[term] = text
+        self._term_ids[text] = term
+        self._sizes[term] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(term)
+            self._arrays.pop(gram, None)
+        return term
+
+    def _unlink(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for field, term in zip(FIELDS, terms):
+            if term is None:
+                continue
+            docs = self._docs[field][term]
+            docs.discard(doc_id)
+            self._counts[field][term] -= 1
+            if not docs:
+                del self._docs[field][term]
+                if not any(term in self._docs[other] for other in FIELDS):
+                    self._drop_term(term)
+
+    def _drop_term(self, term):
+        text = self._terms[term]
+        for gram in trigrams(text):
+            postings = self._postings[gram]
+            postings.discard(term)
+            if not postings:
+                del self._postings[gram]
+            self._arrays.pop(gram, None)
+        del self._term_ids[text]
+        self._terms[term] = None
+        self._sizes[term] = 0
+        self._free.append(term)
+
+    # -- queries --------------------------------------------------------------
+
+    def _hits(self, grams):
+        """Number of query trigrams each term contains, indexed by term id"""
+        arrays = []
+        for gram in grams:
+            array = self._arrays.get(gram)
+            if array is None:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    continue
+                array = self._arrays[gram] = np.fromiter(postings, dtype='int64', count=len(postings))
+            arrays.append(array)
+        if not arrays:
+            return np.zeros(len(self._terms), dtype='int64')
+        return np.bincount(np.concatenate(arrays), minlength=len(self._terms))
+
+    def _scored_terms(self, query, fields, threshold, count=None):
+        """
+        [(score, field, term)] scoring at least `threshold`, best first (the best
+        `count` only, if given); ties come in term id order.
+        """
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        hits = self._hits(grams)
+        # Either score is at most shared / len(grams), so texts sharing fewer trigrams cannot qualify
+        min_shared = max(1, math.ceil(threshold * len(grams) - 1e-9))
+        candidates = np.flatnonzero(hits >= min_shared)
+        shared = hits[candidates]
+
+        terms, scores, codes = [], [], []
+        for code, field in enumerate(FIELDS):
+            if field not in fields:
+                continue
+            if field == "bill_name":
+                score = shared / (len(grams) + self._sizes[candidates] - shared)
+            else:
+                score = NOTES_WEIGHT * shared / len(grams)
+            keep = (self._counts[field][candidates] > 0) & (score >= threshold)
+            terms.append(candidates[keep])
+            scores.append(score[keep])
+            codes.append(np.full(int(keep.sum()), code))
+        if not terms:
+            return []
+        terms, scores, codes = np.concatenate(terms), np.concatenate(scores), np.concatenate(codes)
+
+        if count is not None and len(scores) > count:
+            top = np.argpartition(-scores, count - 1)[:count]
+            terms, scores, codes = terms[top], scores[top], codes[top]
+        order = np.lexsort((terms, -scores))
+        return [
+            (score, FIELDS[code], term)
+            for score, code, term in zip(scores[order].tolist(), codes[order].tolist(), terms[order].tolist())
+        ]
+
+    def search(self, query, limit=20, threshold=DEFAULT_THRESHOLD, fields=FIELDS):
+        """
+        Up to `limit` (doc_id, score, field) matches scoring at least
+        `threshold`, best first; each bill appears once, with its best field.
+        Bills sharing a text come in doc id order.
+        """
+        with self._lock:
+            matches = []
+            seen = set()
+            # A bill can match through both fields, so 2 * limit texts always cover `limit` bills
+            for score, field, term in self._scored_terms(query, fields, threshold, count=2 * limit):
+                needed = limit - len(matches)
+                for doc_id in heapq.nsmallest(needed + len(seen), self._docs[field][term]):
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    matches.append((doc_id, score, field))
+                    if len(matches) >= limit:
+                        return matches
+            return matches
+
+    def docs_named(self, name):
+        """Doc ids of bills whose name normalises to the same text as `name` (a superset of exact matches)"""
+        with self._lock:
+            term = self._term_ids.get(normalize(name))
+            return sorted(self._docs["bill_name"].get(term, ())) if term is not None else []
+
+    def resolve_name(self, name, threshold):
+        """
+        The bills whose name best matches `name`, as (doc_ids, score, tied).
+        doc_ids holds every bill with the best name, or is empty if no name
+        reaches `threshold`. If several names score equally well, `tied` holds
+        one doc id per tied name, the best included, so callers can show the
+        names as stored; otherwise it is empty.
+        """
+        with self._lock:
+            scored = self._scored_terms(name, ("bill_name",), threshold)
+            if not scored:
+                return [], 0.0, []
+            best_score = scored[0][0]
+            best = [term for score, _, term in scored if score == best_score]
+            tied = [min(self._docs["bill_name"][term]) for term in best] if len(best) > 1 else []
+            return sorted(self._docs["bill_name"][best[0]]), best_score, tied
@@ -0,0 +1,337 @@
+"""
+Columnar, versioned snapshot of the bills table shared by the read endpoints.
+
+Instead of every request calling db.all() (which re-parses the whole JSON file
+into dict-like Documents), readers take the current BillSnapshot: parallel
+NumPy arrays for amount and due date, interned category/name/due-date strings
+stored as integer codes, packed bitsets for paid and recurring, and each bill
+pre-encoded as compact JSON so list endpoints can be served by joining bytes.
+
+Snapshots are immutable. SnapshotStore queues the change journal's entries and
+applies them to a copy of the latest snapshot the next time a reader asks for
+one, so writes stay cheap, a burst of writes is folded into one new version,
+and readers never see a half-applied change.
+"""
+import json
+import threading
+
+import numpy as np
+
+from fields import parse_amount, parse_date, to_day
+from recurrence import occurrence
+
+# Due-date sentinels: a due_date that could not be parsed, and no due_date at all
+NO_DATE = np.iinfo(np.int64).min
+MISSING_DATE = NO_DATE + 1
+
+# Placeholder for the due date and index while encoding an occurrence template
+_MARK = "\x00"
+_DUE_DATE_MARK = b'"due_date":"\\u0000"'
+_INDEX_MARK = b'"occurrence":"\\u0000"'
+
+
+def encode_document(document):
+    """Encode a bill exactly as jsonify would, so joined rows are a valid response body"""
+    return json.dumps(document, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def occurrence_template(row):
+    """
+    Split an encoded bill's later occurrences into the parts around the due
+    date and the occurrence index (keys are sorted, so due_date comes first).
+    """
+    encoded = encode_document(occurrence(json.loads(row), _MARK, _MARK))
+    head, rest = encoded.split(_DUE_DATE_MARK, 1)
+    middle, tail = rest.split(_INDEX_MARK, 1)
+    return head + b'"due_date":"', b'"' + middle + b'"occurrence":', tail
+
+
+class StringTable:
+    """Append-only string interning table shared by every snapshot version"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _due_day(bill):
+    if 'due_date' not in bill or not bill['due_date']:
+        return MISSING_DATE
+    due_date = parse_date(bill['due_date'])
+    return to_day(due_date) if due_date else NO_DATE
+
+
+class BillSnapshot:
+    """One immutable version of the bills table, rows ordered by TinyDB doc id"""
+
+    COLUMNS = ("doc_ids", "amounts", "days", "category_codes", "name_codes", "due_date_codes", "rows")
+
+    def __init__(self, version, tables, doc_ids, amounts, days, category_codes, name_codes,
+                 due_date_codes, paid_bits, recurring_bits, rows, templates=None):
+        self.version = version
+        self._tables = tables
+        self._templates = templates if templates is not None else {}
+        self.doc_ids = doc_ids
+        self.amounts = amounts
+        self.days = days
+        self.category_codes = category_codes
+        self.name_codes = name_codes
+        self.due_date_codes = due_date_codes
+        self.paid_bits = paid_bits
+        self.recurring_bits = recurring_bits
+        self.rows = rows
+        self._paid = None
+        self._recurring = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    # -- construction ---------------------------------------------------------
+
+    @staticmethod
+    def _encode_bills(tables, items):
+        """Column values for (doc_id, bill) pairs"""
+        categories, names, due_dates = tables
+        columns = {name: [] for name in BillSnapshot.COLUMNS}
+        paid, recurring = [], []
+        for doc_id, bill in items:
+            columns["doc_ids"].append(int(doc_id))
+            columns["amounts"].append(parse_amount(bill))
+            columns["days"].append(_due_day(bill))
+            columns["category_codes"].append(categories.code(bill.get('category', 'Other')))
+            columns["name_codes"].append(names.code(bill.get('bill_name')))
+            columns["due_date_codes"].append(due_dates.code(bill.get('due_date')))
+            columns["rows"].append(encode_document(bill))
+            paid.append(bool(bill.get('paid')))
+            recurring.append(bool(bill.get('recurring')))
+        return columns, paid, recurring
+
+    @staticmethod
+    def _arrays(columns):
+        rows = np.empty(len(columns["rows"]), dtype=object)
+        rows[:] = columns["rows"]
+        return {
+            "doc_ids": np.array(columns["doc_ids"], dtype='int64'),
+            "amounts": np.array(columns["amounts"], dtype='float64'),
+            "days": np.array(columns["days"], dtype='int64'),
+            "category_codes": np.array(columns["category_codes"], dtype='int32'),
+            "name_codes": np.array(columns["name_codes"], dtype='int32'),
+            "due_date_codes": np.array(columns["due_date_codes"], dtype='int32'),
+            "rows": rows,
+        }
+
+    @classmethod
+    def from_table(cls, table, version=0):
+        """Build a snapshot from a raw TinyDB table (doc id -> document)"""
+        tables = (StringTable(), StringTable(), StringTable())
+        items = sorted(((int(doc_id), bill) for doc_id, bill in table.items()), key=lambda item: item[0])
+        columns, paid, recurring = cls._encode_bills(tables, items)
+        return cls(
+            version, tables,
+            paid_bits=np.packbits(np.array(paid, dtype=bool)),
+            recurring_bits=np.packbits(np.array(recurring, dtype=bool)),
+            **cls._arrays(columns),
+        )
+
+    def apply(self, entries, version):
+        """A new snapshot with journal entries applied (this one is left untouched)"""
+        upserts, removed = {}, set()
+        for entry in entries:
+            if entry["op"] == "upsert":
+                for doc_id, bill in entry["docs"].items():
+                    upserts[int(doc_id)] = bill
+                    removed.discard(int(doc_id))
+            else:
+                for doc_id in entry["ids"]:
+                    upserts.pop(int(doc_id), None)
+                    removed.add(int(doc_id))
+
+        # Copies, so readers holding this snapshot never see the changes
+        arrays = {name: getattr(self, name).copy() for name in self.COLUMNS}
+        paid, recurring = self.paid.copy(), self.recurring.copy()
+
+        if upserts:
+            columns, new_paid, new_recurring = self._encode_bills(self._tables, sorted(upserts.items()))
+            new_arrays = self._arrays(columns)
+            new_paid, new_recurring = np.array(new_paid, dtype=bool), np.array(new_recurring, dtype=bool)
+
+            # Bills that already have a row are overwritten in place
+            rows, existing = self.rows_for(new_arrays["doc_ids"])
+            for name in self.COLUMNS:
+                arrays[name][rows] = new_arrays[name][existing]
+            paid[rows], recurring[rows] = new_paid[existing], new_recurring[existing]
+
+            # New bills are appended; they normally have the highest doc ids, keeping rows sorted
+            added = ~existing
+            if added.any():
+                arrays = {name: np.concatenate((arrays[name], new_arrays[name][added])) for name in self.COLUMNS}
+                paid = np.concatenate((paid, new_paid[added]))
+                recurring = np.concatenate((recurring, new_recurring[added]))
+                if len(arrays["doc_ids"]) > 1 and np.any(np.diff(arrays["doc_ids"]) < 0):
+                    order = np.argsort(arrays["doc_ids"], kind='stable')
+                    arrays = {name: column[order] for name, column in arrays.items()}
+                    paid, recurring = paid[order], recurring[order]
+
+        if removed:
+            keep = ~np.isin(arrays["doc_ids"], np.fromiter(removed, dtype='int64'))
+            arrays = {name: column[keep] for name, column in arrays.items()}
+            paid, recurring = paid[keep], recurring[keep]
+
+        # Occurrence templates of unchanged bills stay valid
+        changed = removed.union(upserts)
+        templates = {doc_id: template for doc_id, template in self._templates.items() if doc_id not in changed}
+
+        return BillSnapshot(
+            version, self._tables,
+            paid_bits=np.packbits(paid), recurring_bits=np.packbits(recurring),
+            templates=templates, **arrays,
+        )
+
+    # -- accessors ------------------------------------------------------------
+
+    @property
+    def categories(self):
+        return self._tables[0].values
+
+    @property
+    def names(self):
+        return self._tables[1].values
+
+    @property
+    def due_dates(self):
+        return self._tables[2].values
+
+    @property
+    def paid(self):
+        if self._paid is None:
+            self._paid = np.unpackbits(self.paid_bits, count=len(self)).astype(bool)
+        return self._paid
+
+    @property
+    def recurring(self):
+        if self._recurring is None:
+            self._recurring = np.unpackbits(self.recurring_bits, count=len(self)).astype(bool)
+        return self._recurring
+
+    def rows_for(self, doc_ids):
+        """Row positions of the given doc ids, and a mask of which ids were found"""
+        doc_ids = np.asarray(doc_ids, dtype='int64')
+        if not len(self.doc_ids):
+            return np.zeros(0, dtype='int64'), np.zeros(len(doc_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.doc_ids, doc_ids), len(self.doc_ids) - 1)
+        found = self.doc_ids[positions] == doc_ids
+        return positions[found], found
+
+    def category_totals(self, mask=None):
+        """Total amount per category over the selected bills (categories with no bills omitted)"""
+        codes = self.category_codes if mask is None else self.category_codes[mask]
+        amounts = self.amounts if mask is None else self.amounts[mask]
+        size = len(self.categories)
+        totals = np.bincount(codes, weights=amounts, minlength=size)
+        present = np.bincount(codes, minlength=size) > 0
+        return {self.categories[code]: float(totals[code]) for code in np.flatnonzero(present)}
+
+    def summaries(self):
+        """(name, amount, due_date) for every bill, e.g. for the AI assistant's prompt"""
+        names, due_dates = self.names, self.due_dates
+        return [
+            {"name": names[name], "amount": amount, "due_date": due_dates[due_date]}
+            for name, amount, due_date in zip(self.name_codes.tolist(), self.amounts.tolist(),
+                                              self.due_date_codes.tolist())
+        ]
+
+    def occurrences(self, doc_ids, days):
+        """
+        Extra analytics rows for expanded occurrences of stored bills:
+        same amount and category as the bill, not yet paid.
+        """
+        rows, found = self.rows_for(doc_ids)
+        return days[found], self.amounts[rows], self.category_codes[rows], np.zeros(len(rows), dtype=bool)
+
+    def occurrence_rows(self, doc_ids, indexes, due_dates):
+        """
+        Encoded occurrences (see recurrence.occurrence) of stored bills, given
+        parallel arrays of doc ids, occurrence indexes and ISO due dates.
+        Occurrence 0 is the stored row itself; ids not in the snapshot are skipped.
+        """
+        rows, found = self.rows_for(doc_ids)
+        encoded = []
+        templates = self._templates
+        for doc_id, row, index, due_date in zip(np.asarray(doc_ids)[found].tolist(), rows.tolist(),
+                                                np.asarray(indexes)[found].tolist(),
+                                                np.asarray(due_dates)[found].astype('S').tolist()):
+            if index == 0:
+                encoded.append(self.rows[row])
+                continue
+            template = templates.get(doc_id)
+            if template is None:
+                template = templates[doc_id] = occurrence_template(self.rows[row])
+            head, middle, tail = template
+            encoded.append(b''.join((head, due_date, middle, str(index).encode(), tail)))
+        return encoded
+
+    def dated_range(self):
+        """(first, last) due date as day numbers, or None if no bill has a usable date"""
+        dated = self.days[self.days > MISSING_DATE]
+        if not len(dated):
+            return None
+        return int(dated.min()), int(dated.max())
+
+
+class SnapshotStore:
+    """
+    Keeps the latest BillSnapshot in sync with the change journal.
+
+    `load_table` returns the raw bills table and is only used for full
+    rebuilds (startup and restores). `write_lock` is the lock writers hold
+    while notifying change listeners; it is taken before the store's own lock
+    so readers catching up and writers queueing changes cannot deadlock.
+
+    The store only sees the entries it is given: with several processes on one
+    database, each must feed it the other processes' entries as well (app.py
+    replays them from the shared journal before every request).
+    """
+
+    def __init__(self, load_table, write_lock, version=0):
+        self._load_table = load_table
+        self._write_lock = write_lock
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._pending = []
+        self._pending_version = version
+        self._needs_rebuild = True
+
+    def on_change(self, entry):
+        """Change listener: queue a journal entry (or a full rebuild after a restore)"""
+        with self._lock:
+            self._pending_version = entry.get("v", self._pending_version)
+            if entry["op"] == "reset":
+                self._needs_rebuild = True
+                self._pending = []
+            else:
+                self._pending.append(entry)
+
+    def current(self):
+        """The snapshot reflecting every write so far"""
+        with self._lock:
+            if not self._needs_rebuild and not self._pending:
+                return self._snapshot
+        with self._write_lock, self._lock:
+            if self._needs_rebuild:
+                self._snapshot = BillSnapshot.from_table(self._load_table(), self._pending_version)
+                self._needs_rebuild = False
+                self._pending = []
+            elif self._pending:
+                self._snapshot = self._snapshot.apply(self._pending, self._pending_version)
+                self._pending = []
+            return self._snapshot
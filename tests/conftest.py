@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """
+    The app module on a scratch database. It is imported once per session: the
+    database, journal, indexes and limiter are module globals created on import.
+    """
+    directory = tmp_path_factory.mktemp("db")
+    os.environ["DB_PATH"] = str(directory / "bills.json")
+    os.environ["RATE_LIMITS"] = "off"
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,77 @@
+"""Restores refuse truncated streams and decompression bombs without inflating them into memory."""
+import gzip
+import io
+import threading
+import zlib
+
+import pytest
+import zstandard
+
+import backup
+from backup import BackupError, decompress_stream
+
+
+def zero_stream(compressor, size, block=1 << 20):
+    """`size` zero bytes compressed without holding them in memory"""
+    zeros = bytes(block)
+    return b"".join(compressor.compress(zeros) for _ in range(size // block)) + compressor.flush()
+
+
+def zstd_bomb(size):
+    return zero_stream(zstandard.ZstdCompressor(level=1).compressobj(), size)
+
+
+def gzip_bomb(size):
+    return zero_stream(zlib.compressobj(1, zlib.DEFLATED, 31), size)
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, zstandard.ZstdCompressor().compress])
+def test_truncated_streams_are_refused(compress):
+    data = compress(b'{"_default": {}}' * 1000)
+    assert b"".join(decompress_stream(io.BytesIO(data))) == b'{"_default": {}}' * 1000
+    with pytest.raises(BackupError, match="truncated"):
+        b"".join(decompress_stream(io.BytesIO(data[:-4])))
+
+
+@pytest.mark.parametrize("bomb", [zstd_bomb, gzip_bomb])
+def test_bombs_are_inflated_in_bounded_pieces(bomb, monkeypatch):
+    monkeypatch.setattr(backup, "MAX_RESTORE_BYTES", 64 << 20)
+    pieces = []
+    with pytest.raises(BackupError, match="restore limit"):
+        for piece in decompress_stream(io.BytesIO(bomb(256 << 20))):
+            pieces.append(len(piece))
+    assert max(pieces) <= 8 << 20
+
+
+def test_upload_of_a_zstd_bomb_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(backup, "MAX_RESTORE_BYTES", 16 << 20)
+    bomb = zstd_bomb(256 << 20)
+    assert len(bomb) < 64 * 1024
+
+    response = client.post("/api/upload-db", data={"file": (io.BytesIO(bomb), "bills.json.zst")})
+    assert response.status_code == 400
+    assert "restore limit" in response.json["error"]
+
+
+def test_restores_do_not_break_concurrent_reads(app_module, client):
+    backup_file = client.get("/api/download-db?compression=none").data
+    statuses, stop = [], threading.Event()
+
+    def read():
+        reader = app_module.app.test_client()
+        while not stop.is_set():
+            statuses.append(reader.get("/bills/1").status_code)
+            statuses.append(reader.get("/category-comparison").status_code)
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(20):
+            response = client.post("/api/upload-db", data={"file": (io.BytesIO(backup_file), "bills.json")})
+            assert response.status_code == 200
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert set(statuses) <= {200, 404}
@@ -0,0 +1,136 @@
+"""
+RecurrenceIndex against a brute-force expansion: every occurrence is stepped
+through one at a time with datetime arithmetic and clamped to the month length
+by hand, then compared with the index's vectorised window arithmetic.
+"""
+import calendar
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from fields import from_day
+from recurrence import FREQUENCIES, RecurrenceIndex, RecurrenceRule
+
+FIRST_DAY = date(2019, 1, 1)
+
+
+def nth_occurrence(anchor, rule, index):
+    in_months, base_step = FREQUENCIES[rule.freq]
+    step = base_step * rule.interval * index
+    if not in_months:
+        return anchor + timedelta(days=step)
+    month = anchor.month - 1 + step
+    year, month = anchor.year + month // 12, month % 12 + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+
+def brute_force(anchor, rule, start, end, include_next=False):
+    """[(index, date)] of the occurrences in [start, end], stepping through the series from its anchor"""
+    found, index = [], 0
+    while rule.count is None or index < rule.count:
+        due = nth_occurrence(anchor, rule, index)
+        if (rule.until is not None and due > rule.until) or due > end:
+            break
+        if due >= start:
+            found.append((index, due))
+        index += 1
+    if include_next and not found:
+        while rule.count is None or index < rule.count:
+            due = nth_occurrence(anchor, rule, index)
+            if rule.until is not None and due > rule.until:
+                break
+            if due >= start:
+                found.append((index, due))
+                break
+            index += 1
+    return found
+
+
+def random_day(rng, span_days=14 * 365):
+    return FIRST_DAY + timedelta(days=rng.randrange(span_days))
+
+
+def random_bill(rng):
+    anchor = random_day(rng)
+    if rng.random() < 0.3:
+        # Days that do not exist in every month exercise the clamping
+        day = min(rng.choice([28, 29, 30, 31]), calendar.monthrange(anchor.year, anchor.month)[1])
+        anchor = anchor.replace(day=day)
+    recurrence = {"freq": rng.choice(list(FREQUENCIES)), "interval": rng.randint(1, 4)}
+    if rng.random() < 0.3:
+        recurrence["count"] = rng.randint(1, 30)
+    if rng.random() < 0.3:
+        recurrence["until"] = (anchor + timedelta(days=rng.randrange(-30, 3 * 365))).isoformat()
+    return {
+        "bill_name": "Recurring",
+        "amount": rng.randint(1, 200),
+        "category": rng.choice(["Rent", "Utilities", "Subscriptions"]),
+        "due_date": anchor.isoformat(),
+        "recurring": True,
+        "recurrence": recurrence,
+    }
+
+
+def expansion(index, start, end, include_next=False):
+    doc_ids, indexes, days = index.expand(start, end, include_next=include_next)
+    found = {}
+    for doc_id, occurrence, day in zip(doc_ids.tolist(), indexes.tolist(), days.tolist()):
+        found.setdefault(doc_id, []).append((occurrence, from_day(day)))
+    return found
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_expand_matches_brute_force(seed):
+    rng = random.Random(seed)
+    bills = {doc_id: random_bill(rng) for doc_id in range(1, 1001)}
+    index = RecurrenceIndex()
+    index.rebuild({str(doc_id): bill for doc_id, bill in bills.items()})
+
+    for _ in range(5):
+        start = random_day(rng, 15 * 365)
+        end = start + timedelta(days=rng.randrange(0, 400))
+        for include_next in (False, True):
+            found = expansion(index, start, end, include_next)
+            for doc_id, bill in bills.items():
+                rule = RecurrenceRule.for_bill(bill)
+                expected = brute_force(date.fromisoformat(bill["due_date"]), rule, start, end, include_next)
+                assert found.get(doc_id, []) == expected, (bill, start, end, include_next)
+
+        found = expansion(index, start, end)
+        doc_ids, counts = index.counts(start, end)
+        assert {doc_id: count for doc_id, count in zip(doc_ids.tolist(), counts.tolist()) if count} == \
+            {doc_id: len(occurrences) for doc_id, occurrences in found.items()}
+
+
+def test_month_end_anchor_is_clamped_and_restored():
+    index = RecurrenceIndex()
+    index.update(1, {"due_date": "2024-01-31", "recurring": True, "recurrence": {"freq": "monthly"}})
+    found = expansion(index, date(2024, 1, 1), date(2024, 5, 31))
+    assert [due.isoformat() for _, due in found[1]] == [
+        "2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31",
+    ]
+
+
+def test_updates_and_removals_match_a_rebuild():
+    rng = random.Random(7)
+    table = {}
+    index = RecurrenceIndex()
+    for _ in range(600):
+        doc_id = rng.randint(1, 150)
+        if rng.random() < 0.75:
+            bill = random_bill(rng)
+            if rng.random() < 0.2:
+                bill["recurring"] = False
+            table[str(doc_id)] = bill
+            index.update(doc_id, bill)
+        else:
+            table.pop(str(doc_id), None)
+            index.remove(doc_id)
+
+    rebuilt = RecurrenceIndex()
+    rebuilt.rebuild(table)
+    start = date(2024, 1, 1)
+    end = start + timedelta(days=366)
+    assert expansion(index, start, end, True) == expansion(rebuilt, start, end, True)
+    assert index.totals_by_category(start, end) == pytest.approx(rebuilt.totals_by_category(start, end))
@@ -0,0 +1,15 @@
+"""Conditional requests against the version ETags of read routes."""
+import pytest
+
+
+@pytest.mark.parametrize("coding", [None, "br", "gzip"])
+def test_if_none_match_uses_weak_comparison(client, coding):
+    headers = {"Accept-Encoding": coding} if coding else {}
+    etag = client.get("/bills", headers=headers).headers["ETag"]
+
+    for cached in (etag, f"W/{etag}", f'"other", W/{etag}'):
+        response = client.get("/bills", headers=dict(headers, **{"If-None-Match": cached}))
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+    assert client.get("/bills", headers=dict(headers, **{"If-None-Match": '"other"'})).status_code == 200
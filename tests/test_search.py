@@ -0,0 +1,54 @@
+"""Fuzzy name resolution and the fuzzy deletes built on it."""
+import pytest
+
+from search import BillSearchIndex
+
+
+@pytest.fixture
+def add_bills(app_module):
+    added = []
+
+    def add(*names):
+        added.extend(app_module.insert_bills({"bill_name": name, "amount": 10, "due_date": "2026-05-01"}
+                                             for name in names))
+
+    yield add
+    app_module.remove_bills(doc_ids=[doc_id for doc_id in added if app_module.db.contains(doc_id=doc_id)])
+
+
+def test_resolve_name_reports_every_tied_name():
+    index = BillSearchIndex()
+    index.update(1, {"bill_name": "Netflix A"})
+    index.update(2, {"bill_name": "Netflix B"})
+    index.update(3, {"bill_name": "Netflix B"})
+
+    doc_ids, score, tied = index.resolve_name("Netflix", 0.5)
+    assert sorted(tied) == [1, 2]
+    assert doc_ids in ([1], [2, 3])
+
+    doc_ids, score, tied = index.resolve_name("Netflix B", 0.5)
+    assert (doc_ids, score, tied) == ([2, 3], 1.0, [])
+
+
+def test_fuzzy_delete_of_a_tied_name_lists_the_stored_names(client, add_bills):
+    add_bills("Zebrafin A", "Zebrafin B")
+    response = client.delete("/bills/by-name", json={"bill_name": "zebrafin", "fuzzy": True})
+    assert response.status_code == 409
+    assert sorted(response.json["candidates"]) == ["Zebrafin A", "Zebrafin B"]
+    assert len(client.get("/bills/search?q=zebrafin").json["matches"]) == 2
+
+
+@pytest.mark.parametrize("threshold", [0, -1, 1.5, "nan"])
+def test_fuzzy_delete_rejects_thresholds_outside_zero_to_one(client, add_bills, threshold):
+    add_bills("Quokkanet Premium")
+    response = client.delete("/bills/by-name", json={"bill_name": "quokka", "threshold": threshold})
+    assert response.status_code == 400
+    assert len(client.get("/bills/search?q=quokkanet").json["matches"]) == 1
+
+
+def test_fuzzy_delete_removes_the_closest_name(client, add_bills):
+    add_bills("Quokkanet Premium")
+    response = client.delete("/bills/by-name", json={"bill_name": "quokkanet premum", "fuzzy": True})
+    assert response.status_code == 200
+    assert response.json["matched_name"] == "Quokkanet Premium"
+    assert client.get("/bills/search?q=quokkanet").json["matches"] == []
@@ -0,0 +1,114 @@
+"""
+BillSnapshot.apply against BillSnapshot.from_table: random batches of journal
+entries are applied incrementally and every column is compared with a
+snapshot built from scratch out of the same table.
+"""
+import json
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from backup import apply_changes
+from snapshot import BillSnapshot, SnapshotStore
+
+CATEGORIES = ["Rent", "Utilities", "Food", "Other"]
+
+
+def random_bill(rng, doc_id):
+    bill = {
+        "id": doc_id,
+        "bill_name": rng.choice(["Rent", "Water Bill", "Netflix", "Gym"]),
+        "amount": rng.choice([rng.randint(1, 500), f"{rng.uniform(1, 99):.2f}", None, "n/a"]),
+        # Every date form the snapshot distinguishes: ISO, other formats, unparseable and empty
+        "due_date": rng.choice(["2026-03-01", "03/15/2026", "2026-13-01", "",
+                                f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}"]),
+        "paid": rng.random() < 0.4,
+        "recurring": rng.random() < 0.3,
+    }
+    if rng.random() < 0.8:
+        bill["category"] = rng.choice(CATEGORIES)
+    if rng.random() < 0.1:
+        del bill["due_date"]
+    return bill
+
+
+def decoded(snapshot):
+    """Every column of a snapshot, with interned codes replaced by their strings"""
+    return {
+        "doc_ids": snapshot.doc_ids.tolist(),
+        "amounts": snapshot.amounts.tolist(),
+        "days": snapshot.days.tolist(),
+        "categories": [snapshot.categories[code] for code in snapshot.category_codes.tolist()],
+        "names": [snapshot.names[code] for code in snapshot.name_codes.tolist()],
+        "due_dates": [snapshot.due_dates[code] for code in snapshot.due_date_codes.tolist()],
+        "rows": list(snapshot.rows),
+        "paid": snapshot.paid.tolist(),
+        "recurring": snapshot.recurring.tolist(),
+    }
+
+
+def random_entries(rng, table, version, count):
+    entries = []
+    for _ in range(count):
+        version += 1
+        if rng.random() < 0.7 or not table:
+            # Mostly new bills with the next doc id, sometimes an earlier or existing one
+            high = max((int(doc_id) for doc_id in table), default=0)
+            doc_ids = {rng.choice([high + 1, rng.randint(1, high + 1)]) for _ in range(rng.randint(1, 3))}
+            entries.append({"v": version, "op": "upsert",
+                            "docs": {str(doc_id): random_bill(rng, doc_id) for doc_id in doc_ids}})
+        else:
+            doc_ids = rng.sample(sorted(int(doc_id) for doc_id in table), min(len(table), rng.randint(1, 3)))
+            entries.append({"v": version, "op": "remove", "ids": doc_ids})
+        apply_changes(table, entries[-1:])
+    return entries
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_apply_matches_a_rebuild(seed):
+    rng = random.Random(seed)
+    table = {str(doc_id): random_bill(rng, doc_id) for doc_id in range(1, 21)}
+    snapshot = BillSnapshot.from_table(table)
+    version = 0
+    for _ in range(200):
+        before = decoded(snapshot)
+        entries = random_entries(rng, table, version, rng.randint(1, 5))
+        version = entries[-1]["v"]
+        updated = snapshot.apply(entries, version)
+
+        assert decoded(snapshot) == before  # readers of the old version never see the change
+        assert updated.version == version
+        assert decoded(updated) == decoded(BillSnapshot.from_table(table, version))
+        snapshot = updated
+
+
+def test_occurrence_rows_follow_updates():
+    bill = {"id": 1, "bill_name": "Rent", "amount": 900, "due_date": "2026-01-01", "recurring": True}
+    snapshot = BillSnapshot.from_table({"1": bill})
+    first = snapshot.occurrence_rows(np.array([1]), np.array([2]), np.array(["2026-03-01"]))
+
+    bill = dict(bill, amount=950)
+    snapshot = snapshot.apply([{"v": 1, "op": "upsert", "docs": {"1": bill}}], 1)
+    second = snapshot.occurrence_rows(np.array([1]), np.array([2]), np.array(["2026-03-01"]))
+
+    assert json.loads(first[0])["amount"] == 900
+    assert json.loads(second[0]) == dict(bill, due_date="2026-03-01", paid=False, status="pending",
+                                          occurrence_of=1, occurrence=2)
+
+
+def test_store_folds_queued_changes_into_one_version():
+    rng = random.Random(11)
+    table = {str(doc_id): random_bill(rng, doc_id) for doc_id in range(1, 6)}
+    store = SnapshotStore(lambda: dict(table), write_lock=threading.RLock())
+    assert decoded(store.current()) == decoded(BillSnapshot.from_table(table))
+
+    for entry in random_entries(rng, table, 0, 30):
+        store.on_change(entry)
+    assert store.current().version == 30
+    assert decoded(store.current()) == decoded(BillSnapshot.from_table(table))
+
+    table.clear()
+    store.on_change({"v": 31, "op": "reset"})
+    assert len(store.current()) == 0
@@ -0,0 +1,23 @@
+"""The ?start=/?end=/?days= window shared by the list, reminder, insight and analytics routes."""
+import pytest
+
+# /analytics/timeseries takes ?start= and ?end= but no ?days=
+WINDOW_ROUTES = ["/bills", "/reminders", "/insights", "/analytics/timeseries"]
+
+
+@pytest.mark.parametrize("url", [f"{route}?start=2026-01-01&end=2025-01-01" for route in WINDOW_ROUTES]
+                         + [f"{route}?start=2026-01-01&days=-5" for route in WINDOW_ROUTES[:3]])
+def test_inverted_windows_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert response.json["error"] == "end must not be before start"
+
+
+@pytest.mark.parametrize("route", WINDOW_ROUTES[:3])
+@pytest.mark.parametrize("days", ["200000", "99999999", "9" * 30])
+def test_oversized_windows_are_rejected(client, route, days):
+    assert client.get(f"{route}?days={days}").status_code == 400
+
+
+def test_single_day_window_is_allowed(client):
+    assert client.get("/bills?start=2026-01-01&end=2026-01-01").status_code == 200